@@ -1,16 +1,282 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+import click
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
 from datetime import datetime, date, timedelta
+import hashlib
+import os
+from markupsafe import Markup, escape
+from itertools import chain
+import time
+from sqlalchemy import event, and_, or_, tuple_, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from cache import ReferenceCache
+from events import KitchenFeed, sse_response
+from conditional import make_etag, not_modified, with_validators, timestamp_to_datetime
+import metrics
+import snapshots
+from pagination import PAGE_SIZE, decode_cursor, encode_cursor, page_size_arg
+from writer import retry_on_busy
+from week_cycles import WeekCycleIndex
 from database import db, Teacher, Student, MenuItem, Choice, WeekCycle, Class
 
 
 DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+REFERENCE_CACHE_TTL = 30  # seconds before another worker's edits are picked up
+MAX_PATCH_CELLS = 50
+BUSY_TIMEOUT = 5  # seconds SQLite waits on a lock before raising
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///cafeteria.db'
+# CAFETERIA_DB points the app at another file, e.g. a generated benchmark database
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.environ.get('CAFETERIA_DB', 'cafeteria.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': BUSY_TIMEOUT}}
 app.secret_key = 'change-me-to-something-secure'
+app.config['SLOW_QUERY_THRESHOLD'] = 0.1  # seconds
 
 db.init_app(app)
+metrics.init_app(app)
+# The shared layout only links the pages this app serves
+app.jinja_env.globals['has_endpoint'] = app.view_functions.__contains__
+
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers carry on while a class's week is being written
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.close()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query_time(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    metrics.record_query_time(statement, time.perf_counter() - started)
+
+
+# ---------------------------------------------------------------------
+#  Data versions
+# ---------------------------------------------------------------------
+# Change counters bumped by the write paths in the same transaction as the
+# change: 'choices' for any order, 'class:<id>' per class and 'reference'
+# for classes, teachers, students, menu items and week cycles. Pages derive
+# their ETag from them, so a conditional GET is answered with one lookup.
+data_versions = db.Table(
+    'data_versions',
+    db.Column('scope', db.String(50), primary_key=True),
+    db.Column('version', db.Integer, nullable=False, default=0),
+    db.Column('updated_at', db.Integer, nullable=False, default=0),
+)
+
+
+def bump_data_versions(connection, *scopes):
+    now = int(time.time())
+    stmt = sqlite_insert(data_versions).values(
+        [{'scope': scope, 'version': 1, 'updated_at': now} for scope in scopes])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[data_versions.c.scope],
+        set_={'version': data_versions.c.version + 1, 'updated_at': stmt.excluded.updated_at})
+    connection.execute(stmt)
+
+
+def get_data_versions(*scopes):
+    """Versions of scopes as a sorted tuple, plus their latest change time"""
+    rows = db.session.execute(
+        data_versions.select().where(data_versions.c.scope.in_(scopes))).all()
+    versions = tuple(sorted((row.scope, row.version) for row in rows))
+    return versions, timestamp_to_datetime(max((row.updated_at for row in rows), default=0))
+
+
+# ---------------------------------------------------------------------
+#  Reference data cache
+# ---------------------------------------------------------------------
+# Cached values are plain row tuples rather than ORM objects, so they stay
+# usable after the session that loaded them has closed.
+REFERENCE_MODELS = (Class, Teacher, Student, MenuItem, WeekCycle)
+
+
+def read_reference_versions():
+    """The shared 'reference' counter as the stamp of every reference table.
+
+    Other workers bump it when they commit an edit, so entries they made stale
+    are reloaded here once their TTL runs out.
+    """
+    version = db.session.execute(
+        select(data_versions.c.version).where(data_versions.c.scope == 'reference')).scalar()
+    return {model.__tablename__: version or 0 for model in REFERENCE_MODELS}
+
+
+reference_cache = ReferenceCache(version_source=read_reference_versions, ttl=REFERENCE_CACHE_TTL)
+
+
+@event.listens_for(Session, 'after_flush')
+def bump_reference_versions(session, flush_context):
+    changed = {obj.__tablename__ for obj in chain(session.new, session.dirty, session.deleted)
+               if isinstance(obj, REFERENCE_MODELS)}
+    if changed:
+        bump_data_versions(session.connection(), 'reference')
+        session.info.setdefault('changed_reference_tables', set()).update(changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def bump_reference_cache(session):
+    # Only once committed, so a load between flush and commit cannot cache
+    # the old rows under the new stamp
+    changed = session.info.pop('changed_reference_tables', None)
+    if changed:
+        reference_cache.bump(*changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_reference_changes(session):
+    session.info.pop('changed_reference_tables', None)
+
+
+def get_classes():
+    return reference_cache.get(
+        'classes', (Class.__tablename__,),
+        lambda: db.session.query(Class.class_id, Class.class_name)
+        .order_by(Class.class_name).all())
+
+
+def get_teachers():
+    return reference_cache.get(
+        'teachers', (Teacher.__tablename__,),
+        lambda: db.session.query(Teacher.teacher_id, Teacher.first_name,
+                                 Teacher.last_name, Teacher.class_id)
+        .order_by(Teacher.last_name).all())
+
+
+def get_menu_items():
+    return reference_cache.get(
+        'menu_items', (MenuItem.__tablename__,),
+        lambda: db.session.query(MenuItem.item_id, MenuItem.item_name,
+                                 MenuItem.monday, MenuItem.tuesday, MenuItem.wednesday,
+                                 MenuItem.thursday, MenuItem.friday)
+        .order_by(MenuItem.item_name).all())
+
+
+def get_students(class_id):
+    return reference_cache.get(
+        ('students', class_id), (Student.__tablename__,),
+        lambda: db.session.query(Student.student_id, Student.first_name,
+                                 Student.last_name, Student.class_id,
+                                 Student.admission_number)
+        .filter_by(class_id=class_id)
+        .order_by(Student.last_name, Student.first_name).all())
+
+
+def get_menu_options():
+    """Pre-rendered <option> lists for the grid, keyed by the selected item id.
+
+    None maps to the list with nothing selected. Built once per menu version,
+    so rendering a cell is a dict lookup instead of a loop over the menu.
+    """
+    def build():
+        menu_items = get_menu_items()
+        options = {}
+        for selected in [None] + [item.item_id for item in menu_items]:
+            parts = [f'<option value=""{" selected" if selected is None else ""}>-- None --</option>']
+            for item in menu_items:
+                mark = ' selected' if item.item_id == selected else ''
+                parts.append(f'<option value="{item.item_id}"{mark}>{escape(item.item_name)}</option>')
+            options[selected] = Markup(''.join(parts))
+        return options
+    return reference_cache.get('menu_options', (MenuItem.__tablename__,), build)
+
+
+def get_week_cycle_index():
+    return reference_cache.get(
+        'week_cycles', (WeekCycle.__tablename__,),
+        lambda: WeekCycleIndex.from_rows(
+            db.session.query(WeekCycle.week_number, WeekCycle.cycle_number,
+                             WeekCycle.start_date, WeekCycle.end_date).all()))
+
+
+def load_item_counts(day):
+    rows = db.session.query(MenuItem.item_name, func.count(Choice.choice_id)) \
+        .join(Choice, Choice.item_id == MenuItem.item_id) \
+        .filter(Choice.choice_date == date.fromisoformat(day)) \
+        .group_by(MenuItem.item_id).all()
+    return {name: count for name, count in rows}
+
+
+def load_class_counts(day, class_ids=None):
+    query = db.session.query(Class.class_name, func.count(Choice.choice_id)) \
+        .outerjoin(Choice, and_(Choice.class_id == Class.class_id,
+                                Choice.choice_date == date.fromisoformat(day)))
+    if class_ids is not None:
+        query = query.filter(Class.class_id.in_(class_ids))
+    return {name: count for name, count in query.group_by(Class.class_id).all()}
+
+
+# Pushes today's counts to kitchen screens after every committed write
+kitchen_feed = KitchenFeed(load_item_counts, load_class_counts)
+
+
+# ---------------------------------------------------------------------
+#  Order cutoff
+# ---------------------------------------------------------------------
+def snapshot_db_path():
+    # Flask-SQLAlchemy resolves a relative SQLite path, so ask the engine
+    return db.engine.url.database
+
+
+def read_day_sheet(day):
+    """A day's per-item and per-class sheet, in the shape snapshots.py writes"""
+    choice_date = date.fromisoformat(day)
+    items = db.session.query(MenuItem.item_name, func.count(Choice.choice_id)) \
+        .join(Choice, Choice.item_id == MenuItem.item_id) \
+        .filter(Choice.choice_date == choice_date) \
+        .group_by(MenuItem.item_id) \
+        .order_by(func.count(Choice.choice_id).desc(), MenuItem.item_name).all()
+    classes = {class_id: {'id': class_id, 'name': name, 'students': []}
+               for class_id, name in get_classes()}
+    rows = db.session.query(Choice.class_id, Student.first_name, Student.last_name,
+                            MenuItem.item_name) \
+        .join(Student, Choice.student_id == Student.student_id) \
+        .join(MenuItem, Choice.item_id == MenuItem.item_id) \
+        .filter(Choice.choice_date == choice_date) \
+        .order_by(Choice.class_id, Student.last_name, Student.first_name).all()
+    for class_id, first_name, last_name, item_name in rows:
+        if class_id in classes:
+            classes[class_id]['students'].append([f'{first_name} {last_name}', item_name])
+    return {'date': day,
+            'items': [[name, count] for name, count in items],
+            'classes': list(classes.values())}
+
+
+def frozen_dates(dates):
+    """The dates whose orders were frozen at the cutoff, or none with override=1"""
+    if request.values.get('override') == '1':
+        return set()
+    db_path = snapshot_db_path()
+    return {choice_date for choice_date in dates
+            if snapshots.is_frozen(db_path, choice_date.isoformat())}
+
+
+def refreeze(dates):
+    """Rewrite the sheets of frozen dates after an overridden edit"""
+    db_path = snapshot_db_path()
+    for choice_date in dates:
+        if snapshots.is_frozen(db_path, choice_date.isoformat()):
+            snapshots.write_snapshot(db_path, read_day_sheet(choice_date.isoformat()))
+
+
+@app.cli.command('freeze')
+@click.argument('day', required=False)
+def freeze_command(day):
+    """Freeze DAY's orders (default today); run at the daily order cutoff."""
+    day = date.fromisoformat(day).isoformat() if day else date.today().isoformat()
+    path = snapshots.write_snapshot(snapshot_db_path(), read_day_sheet(day))
+    print(f"Froze orders for {day} into {path}")
 
 
 def current_teacher():
@@ -30,8 +296,7 @@ def login():
         if teacher:
             session['teacher_id'] = teacher.teacher_id
             return redirect(url_for('teacher_board'))
-    teachers = Teacher.query.order_by(Teacher.last_name).all()
-    return render_template('login.html', teachers=teachers)
+    return render_template('login.html', teachers=get_teachers())
 
 
 @app.route('/logout')
@@ -52,26 +317,106 @@ def teacher_board():
     monday = today - timedelta(days=today.weekday())
     week_start = datetime.strptime(week_start_str, '%Y-%m-%d').date() if week_start_str else monday
 
-    students = Student.query.filter_by(class_id=teacher.class_id) \
-        .order_by(Student.last_name, Student.first_name).all()
-    menu_items = MenuItem.query.order_by(MenuItem.item_name).all()
+    versions, last_modified = get_data_versions('reference', f'class:{teacher.class_id}')
+    etag = make_etag('teacher', teacher.teacher_id, week_start.isoformat(), versions)
+    cached = not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
 
-    # Load existing choices for this week
+    students = get_students(teacher.class_id)
+
+    # Load existing choices for this week, keyed by (student_id, day index)
     existing_choices = {}
-    choices = Choice.query.filter_by(class_id=teacher.class_id) \
+    choices = get_week_choices(teacher.class_id, week_start)
+    for choice in choices:
+        existing_choices[(choice.student_id, (choice.choice_date - week_start).days)] = choice.item_id
+
+    return with_validators(render_template('teacher_board.html',
+                                           teacher=teacher,
+                                           students=students,
+                                           menu_options=get_menu_options(),
+                                           week_start=week_start,
+                                           week_dates=[week_start + timedelta(days=offset)
+                                                       for offset in range(len(DAYS))],
+                                           week_version=week_version(choices),
+                                           DAYS=DAYS,
+                                           existing_choices=existing_choices),
+                           etag, last_modified)
+
+
+def get_week_choices(class_id, week_start):
+    return Choice.query.filter_by(class_id=class_id) \
         .filter(Choice.choice_date.between(week_start, week_start + timedelta(days=4))) \
         .all()
-    for choice in choices:
-        key = f"{choice.student_id}-{choice.day_of_week}"
-        existing_choices[key] = choice.item_id
 
-    return render_template('teacher_board.html',
-                           teacher=teacher,
-                           students=students,
-                           menu_items=menu_items,
-                           week_start=week_start,
-                           DAYS=DAYS,
-                           existing_choices=existing_choices)
+
+def week_version(choices):
+    """Version token for a class's week, derived from the saved cells"""
+    state = sorted((c.student_id, c.choice_date.isoformat(), c.item_id) for c in choices)
+    return hashlib.sha1(repr(state).encode()).hexdigest()[:16]
+
+
+def diff_week_choices(existing, submitted):
+    """Compare the saved week grid with the submitted one.
+
+    Both map (student_id, choice_date) to an item id. Returns the keys to
+    insert, update and delete so only changed cells are written.
+    """
+    inserts = [key for key in submitted if key not in existing]
+    updates = [key for key, item_id in submitted.items()
+               if key in existing and existing[key] != item_id]
+    deletes = [key for key in existing if key not in submitted]
+    return inserts, updates, deletes
+
+
+def save_cells(class_id, cells, day_names=None, replace_week=False):
+    """Bring a class's saved choices in line with cells and commit.
+
+    cells maps (student_id, choice_date) to an item id, or None to clear the
+    cell. With replace_week, saved choices on the dates in cells that are not
+    in cells are deleted too. Returns the number of cells that changed.
+    """
+    dates = {choice_date for _, choice_date in cells}
+    query = Choice.query.filter_by(class_id=class_id)
+    if replace_week:
+        query = query.filter(Choice.choice_date.in_(dates))
+    else:
+        query = query.filter(Choice.choice_date.in_(dates),
+                             Choice.student_id.in_({student_id for student_id, _ in cells}))
+    existing = {(choice.student_id, choice.choice_date): choice for choice in query
+                if replace_week or (choice.student_id, choice.choice_date) in cells}
+
+    submitted = {key: item_id for key, item_id in cells.items() if item_id is not None}
+    inserts, updates, deletes = diff_week_choices(
+        {key: choice.item_id for key, choice in existing.items()}, submitted)
+    cycles = get_week_cycle_index().resolve(dates) if inserts else {}
+
+    for key in deletes:
+        db.session.delete(existing[key])
+    for key in updates:
+        existing[key].item_id = submitted[key]
+    for student_id, choice_date in inserts:
+        wc = cycles[choice_date]
+        db.session.add(
+            Choice(student_id=student_id,
+                   class_id=class_id,
+                   choice_date=choice_date,
+                   day_of_week=(day_names or {}).get(choice_date, DAYS[choice_date.weekday()]),
+                   item_id=submitted[(student_id, choice_date)],
+                   week_number=wc.week_number if wc else None,
+                   cycle_number=wc.cycle_number if wc else None)
+        )
+    changed = len(inserts) + len(updates) + len(deletes)
+    if changed:
+        bump_data_versions(db.session.connection(), 'choices', f'class:{class_id}')
+    db.session.commit()
+    if changed:
+        refreeze(dates)
+
+    today = date.today()
+    if changed and today in dates:
+        kitchen_feed.refresh(today.isoformat(), [class_id])
+    return changed
 
 
 @app.route('/submit_week', methods=['POST'])
@@ -81,60 +426,232 @@ def submit_week():
         return redirect(url_for('login'))
 
     week_start = datetime.strptime(request.form['week_start'], '%Y-%m-%d').date()
+    week_dates = [week_start + timedelta(days=offset) for offset in range(len(DAYS))]
+
+    # Submitted grid: (student_id, date) -> item_id, None for blank cells
+    submitted = {}
+    for student in get_students(teacher.class_id):
+        for choice_date, day in zip(week_dates, DAYS):
+            item_id = request.form.get(f"c-{student.student_id}-{day}", '')
+            submitted[(student.student_id, choice_date)] = int(item_id) if item_id.isdigit() else None
+
+    # Days frozen at the cutoff keep their orders unless the form overrides it
+    frozen = frozen_dates(week_dates)
+    submitted = {key: item_id for key, item_id in submitted.items() if key[1] not in frozen}
+    if not submitted:
+        flash('Orders for this week are closed.', 'error')
+        return redirect(url_for('teacher_board', week_start=week_start.isoformat()))
+
+    try:
+        changed = retry_on_busy(
+            lambda: save_cells(teacher.class_id, submitted, dict(zip(week_dates, DAYS)),
+                               replace_week=True),
+            on_retry=db.session.rollback)
+    except SQLAlchemyError:
+        db.session.rollback()
+        flash('Lunch orders could not be saved, please try again.', 'error')
+        return redirect(url_for('teacher_board', week_start=week_start.isoformat()))
+
+    if frozen:
+        closed = ', '.join(DAYS[choice_date.weekday()] for choice_date in sorted(frozen))
+        flash(f'Lunch orders saved ({changed} changed); {closed} closed and kept as they were.',
+              'warning')
+    else:
+        flash(f'Lunch orders saved successfully! ({changed} changed)', 'success')
+    return redirect(url_for('teacher_board', week_start=week_start.isoformat()))
 
-    # choices for the class and week
-    Choice.query.filter_by(class_id=teacher.class_id) \
-        .filter(Choice.choice_date.between(week_start, week_start + timedelta(days=4))) \
-        .delete()
-    db.session.commit()
 
-    choices_to_add = []
-    students = Student.query.filter_by(class_id=teacher.class_id).all()
-
-    for student in students:
-        for offset, day in enumerate(DAYS):
-            field = f"c-{student.student_id}-{day}"
-            item_id = request.form.get(field)
-            if not item_id:
-                continue
-
-            choice_date = week_start + timedelta(days=offset)
-            wc = WeekCycle.query.filter(WeekCycle.start_date <= choice_date,
-                                        WeekCycle.end_date >= choice_date).first()
-
-            choices_to_add.append(
-                Choice(student_id=student.student_id,
-                       class_id=teacher.class_id,
-                       choice_date=choice_date,
-                       day_of_week=day,
-                       item_id=item_id,
-                       week_number=wc.week_number if wc else None,
-                       cycle_number=wc.cycle_number if wc else None)
-            )
-
-    db.session.bulk_save_objects(choices_to_add)
-    db.session.commit()
-    flash('Lunch orders saved successfully!', 'success')
-    return redirect(url_for('teacher_board', week_start=week_start.isoformat()))
+def parse_cells(payload, class_id):
+    """Validate a PATCH body into {(student_id, date): item_id or None}.
+
+    Returns the cells and an error message (None when the body is valid).
+    """
+    cells = payload.get('cells') if isinstance(payload, dict) else None
+    if not isinstance(cells, list) or not cells:
+        return None, 'Expected a non-empty "cells" list'
+    if len(cells) > MAX_PATCH_CELLS:
+        return None, f'At most {MAX_PATCH_CELLS} cells per request'
+
+    student_ids = {student.student_id for student in get_students(class_id)}
+    item_ids = {item.item_id for item in get_menu_items()}
+    parsed = {}
+    for cell in cells:
+        try:
+            student_id = int(cell['student_id'])
+            choice_date = datetime.strptime(cell['date'], '%Y-%m-%d').date()
+            item_id = cell.get('item_id')
+            item_id = int(item_id) if item_id not in (None, '') else None
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return None, f'Malformed cell: {cell!r}'
+        if student_id not in student_ids:
+            return None, f'Student {student_id} is not in this class'
+        if item_id is not None and item_id not in item_ids:
+            return None, f'Unknown menu item {item_id}'
+        if choice_date.weekday() >= len(DAYS):
+            return None, f'{choice_date} is not a school day'
+        parsed[(student_id, choice_date)] = item_id
+
+    # All cells must sit in the same school week so one version token covers them
+    mondays = {choice_date - timedelta(days=choice_date.weekday()) for _, choice_date in parsed}
+    if len(mondays) > 1:
+        return None, 'All cells must be in the same week'
+    return parsed, None
+
+
+@app.route('/api/classes/<int:class_id>/choices', methods=['PATCH'])
+def patch_choices(class_id):
+    """Apply a few grid cells in place; setting the same value twice is a no-op"""
+    teacher = current_teacher()
+    if not teacher:
+        return jsonify(error='Not logged in'), 401
+    if teacher.class_id != class_id:
+        return jsonify(error='Not your class'), 403
+
+    cells, error = parse_cells(request.get_json(silent=True), class_id)
+    if error:
+        return jsonify(error=error), 400
+    frozen = frozen_dates({choice_date for _, choice_date in cells})
+    if frozen:
+        return jsonify(error='Orders are closed for ' +
+                       ', '.join(choice_date.isoformat() for choice_date in sorted(frozen))), 409
+
+    try:
+        changed = retry_on_busy(lambda: save_cells(class_id, cells),
+                                on_retry=db.session.rollback)
+    except SQLAlchemyError:
+        db.session.rollback()
+        return jsonify(error='Could not save, please try again'), 500
+
+    any_date = next(iter(cells))[1]
+    week_start = any_date - timedelta(days=any_date.weekday())
+    return jsonify(
+        cells=[{'student_id': student_id, 'date': choice_date.isoformat(), 'item_id': item_id}
+               for (student_id, choice_date), item_id in cells.items()],
+        changed=changed,
+        version=week_version(get_week_choices(class_id, week_start))
+    )
+
+
+# The admin listing walks choices newest day first. create_all adds it to new
+# databases; python app.py also adds it to existing ones.
+choices_date_index = db.Index('ix_choices_choice_date_class', Choice.choice_date, Choice.class_id)
+
+
+def admin_page_start_date(filters, limit):
+    """Oldest day a page of limit orders reaches, or None when it needs every day.
+
+    Counts the matching orders per day, newest first, and stops reading once
+    enough days are found, so the page query only joins and sorts those days.
+    """
+    counts = db.session.query(Choice.choice_date, func.count(Choice.choice_id)) \
+        .join(Student, Choice.student_id == Student.student_id) \
+        .join(MenuItem, Choice.item_id == MenuItem.item_id) \
+        .filter(*filters) \
+        .group_by(Choice.choice_date) \
+        .order_by(Choice.choice_date.desc()) \
+        .yield_per(1)  # each further day costs a day's join, so fetch them one by one
+    total = 0
+    for choice_date, count in counts:
+        total += count
+        if total >= limit:
+            return choice_date
+    return None
+
+
+def get_admin_page(filter_date=None, filter_class=None, cursor=None, page_size=PAGE_SIZE):
+    """One page of orders as flat rows, in a single joined query.
+
+    Ordered by (date DESC, student surname, choice id). Returns the rows and
+    the cursor for the following page, or None on the last page.
+    """
+    query = db.session.query(
+        Choice.choice_id,
+        Choice.choice_date,
+        Choice.day_of_week,
+        Choice.week_number,
+        Choice.cycle_number,
+        Student.last_name,
+        (Student.first_name + ' ' + Student.last_name).label('student_name'),
+        Class.class_name,
+        MenuItem.item_name.label('menu_item_name'),
+    ).join(Student, Choice.student_id == Student.student_id) \
+        .outerjoin(Class, Student.class_id == Class.class_id) \
+        .join(MenuItem, Choice.item_id == MenuItem.item_id)
+
+    filters = []
+    if filter_date:
+        filters.append(Choice.choice_date == filter_date)
+    if filter_class:
+        filters.append(Choice.class_id == filter_class)
+    if cursor:
+        choice_date, last_name, choice_id = cursor
+        # The plain bound lets the date index start at the cursor's day
+        filters.append(Choice.choice_date <= choice_date)
+        filters.append(or_(
+            Choice.choice_date < choice_date,
+            and_(Choice.choice_date == choice_date,
+                 tuple_(Student.last_name, Choice.choice_id) > tuple_(last_name, choice_id))))
+    start = admin_page_start_date(filters, page_size + 1)
+    if start is not None:
+        filters.append(Choice.choice_date >= start)
+
+    rows = query.filter(*filters).order_by(Choice.choice_date.desc(), Student.last_name, Choice.choice_id) \
+        .limit(page_size + 1).all()
+
+    # The extra row only tells us whether another page exists
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        return rows, encode_cursor([last.choice_date.isoformat(), last.last_name, last.choice_id])
+    return rows, None
+
+
+def decode_admin_cursor(cursor):
+    key = decode_cursor(cursor, 3)
+    try:
+        choice_date, last_name, choice_id = key
+        return (datetime.strptime(choice_date, '%Y-%m-%d').date(),
+                str(last_name), int(choice_id))
+    except (ValueError, TypeError):
+        return None
 
 
 @app.route('/admin')
 def admin_menu():
+    versions, last_modified = get_data_versions('choices', 'reference')
+    etag = make_etag('admin', request.query_string, versions)
+    cached = not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+
     # Get filter parameters
     filter_date = request.args.get('filter_date')
-    filter_class = request.args.get('filter_class')
+    try:
+        filter_date = datetime.strptime(filter_date, '%Y-%m-%d').date() if filter_date else None
+    except ValueError:
+        filter_date = None
+    filter_class = request.args.get('filter_class', '')
+    filter_class = int(filter_class) if filter_class.isdigit() else None
+    cursor = request.args.get('cursor')
+    cursor = decode_admin_cursor(cursor) if cursor else None
 
-    query = Choice.query.join(Student).join(MenuItem)
+    choices, next_cursor = get_admin_page(filter_date, filter_class, cursor,
+                                          page_size_arg(request.args))
+    classes = get_classes()
 
-    if filter_date:
-        query = query.filter(Choice.choice_date == filter_date)
-    if filter_class:
-        query = query.filter(Choice.class_id == filter_class)
+    return with_validators(render_template('admin_menu.html', choices=choices, classes=classes,
+                                           next_cursor=next_cursor),
+                           etag, last_modified)
+
+
+@app.route('/kitchen')
+def kitchen():
+    return render_template('kitchen.html')
 
-    choices = query.order_by(Choice.choice_date.desc(), Student.last_name).all()
-    classes = Class.query.all()
 
-    return render_template('admin_menu.html', choices=choices, classes=classes)
+@app.route('/kitchen/stream')
+def kitchen_stream():
+    return sse_response(kitchen_feed, date.today().isoformat())
 
 
 # Initialize database with sample data
@@ -182,5 +699,6 @@ def init_sample_data():
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        choices_date_index.create(db.engine, checkfirst=True)
         init_sample_data()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,142 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import date
+
+ARCHIVE_DIR = 'archive'  # next to the live database
+ARCHIVE_ALIAS = 'archive'
+
+
+def archive_path(db_path, path):
+    """Absolute path of an archive catalogued relative to the live database"""
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), path)
+
+
+def archive_choices(before, db_path='cafeteria.db'):
+    """Move every choice from before the week cycle holding `before` into a term archive.
+
+    Run it once a term has finished, with the first day of the term that
+    follows. The cut-off snaps back to the start of the Week_Cycles row that
+    contains `before` (never later than today), so a cycle is never split
+    across two files. Rows are copied to archive/<db name>/choices_<first>_<last>.db,
+    catalogued in Choice_Archives and only then deleted from Choices. The
+    rollup keeps the archived days' counts. Returns the catalogue row written,
+    or None when there was nothing to archive.
+    """
+    before = min(before, date.today().isoformat())
+    conn = sqlite3.connect(db_path)
+    conn.isolation_level = None  # transactions are managed explicitly below
+    try:
+        cutoff = conn.execute(
+            "SELECT MAX(start_date) FROM Week_Cycles WHERE start_date <= ?", (before,)
+        ).fetchone()[0] or before
+        first, last, row_count = conn.execute(
+            "SELECT MIN(date), MAX(date), COUNT(*) FROM Choices WHERE date < ?", (cutoff,)
+        ).fetchone()
+        if not row_count:
+            print(f"No choices before {cutoff} to archive.")
+            return None
+
+        # One folder per database, so schools sharing a directory never collide
+        stem = os.path.splitext(os.path.basename(db_path))[0]
+        relative_path = os.path.join(ARCHIVE_DIR, stem, f'choices_{first}_{last}.db')
+        path = archive_path(db_path, relative_path)
+        if conn.execute("SELECT 1 FROM Choice_Archives WHERE path = ?", (relative_path,)).fetchone():
+            raise SystemExit(f"{relative_path} is already catalogued; move it aside first")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            # Left behind by a run that stopped before cataloguing it
+            os.remove(path)
+
+        conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_ALIAS}", (path,))
+        try:
+            # Write and commit the archive before anything is removed from Choices
+            conn.execute("BEGIN")
+            conn.execute(f'''
+                CREATE TABLE {ARCHIVE_ALIAS}.Choices (
+                    id INTEGER PRIMARY KEY,
+                    student_id INTEGER NOT NULL,
+                    menu_item_id INTEGER NOT NULL,
+                    class_id INTEGER NOT NULL,
+                    date DATE NOT NULL
+                )
+            ''')
+            conn.execute(f'''
+                INSERT INTO {ARCHIVE_ALIAS}.Choices (id, student_id, menu_item_id, class_id, date)
+                SELECT id, student_id, menu_item_id, class_id, date
+                FROM main.Choices WHERE date < ?
+                ORDER BY date, class_id
+            ''', (cutoff,))
+            conn.execute(f'''
+                CREATE INDEX {ARCHIVE_ALIAS}.idx_archived_choices_date
+                ON Choices (date, class_id)
+            ''')
+            conn.execute("COMMIT")
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM main.Choices WHERE date < ?", (cutoff,))
+                # The delete triggers emptied these days in the rollup; put them back
+                conn.execute(f'''
+                    INSERT INTO main.Daily_Item_Counts (date, menu_item_id, count)
+                    SELECT date, menu_item_id, COUNT(*)
+                    FROM {ARCHIVE_ALIAS}.Choices
+                    GROUP BY date, menu_item_id
+                ''')
+                conn.execute('''
+                    INSERT INTO main.Choice_Archives (path, start_date, end_date, row_count)
+                    VALUES (?, ?, ?, ?)
+                ''', (relative_path, first, last, row_count))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            conn.execute(f"DETACH DATABASE {ARCHIVE_ALIAS}")
+    finally:
+        conn.close()
+    print(f"Archived {row_count} choices from {first} to {last} into {relative_path}")
+    return {'path': relative_path, 'start_date': first, 'end_date': last, 'row_count': row_count}
+
+
+def find_archives(conn, db_path, filter_date=None, before=None):
+    """Catalogue rows of the archives that can hold matching choices, newest first.
+
+    filter_date keeps the archive covering that day; before drops archives
+    that only hold days after it (e.g. pages already past them). Archives
+    whose file is missing are skipped with a warning, since ATTACH would
+    create an empty database in their place.
+    """
+    clauses = []
+    params = []
+    if filter_date:
+        clauses.append('start_date <= ? AND end_date >= ?')
+        params.extend([filter_date, filter_date])
+    if before:
+        clauses.append('start_date <= ?')
+        params.append(before)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    rows = conn.execute(f'''
+        SELECT path, start_date, end_date FROM Choice_Archives
+        {where}
+        ORDER BY end_date DESC
+    ''', params).fetchall()
+    found = []
+    for row in rows:
+        if os.path.exists(archive_path(db_path, row[0])):
+            found.append(row)
+        else:
+            print(f"Warning: archive {row[0]} ({row[1]} to {row[2]}) is missing; skipping it")
+    return found
+
+
+@contextmanager
+def attached(conn, db_path, path):
+    """ATTACH an archive as `archive` for the duration of the block"""
+    conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_ALIAS}", (archive_path(db_path, path),))
+    try:
+        yield ARCHIVE_ALIAS
+    finally:
+        conn.execute(f"DETACH DATABASE {ARCHIVE_ALIAS}")
@@ -0,0 +1,271 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from flask import g, request_finished
+
+from datagen import DAYS, add_scale_arguments, generate_app_db, generate_main_db, school_from_args
+
+PERCENTILES = (50, 90, 95, 99)
+EDIT_RATIO = 0.1  # share of cells a benchmarked submission changes
+DEFAULT_TOLERANCE = 0.25  # allowed p95 slowdown before --compare reports a regression
+
+
+# ---------------------------------------------------------------------
+#  Measuring
+# ---------------------------------------------------------------------
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-pct * len(sorted_values) // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarise(latencies, statements, statuses):
+    latencies = sorted(seconds * 1000 for seconds in latencies)
+    summary = {'requests': len(latencies),
+               'errors': sum(count for status, count in statuses.items() if int(status) >= 500),
+               'statuses': statuses,
+               'latency_ms': {f'p{pct}': round(percentile(latencies, pct), 3) for pct in PERCENTILES}}
+    summary['latency_ms']['max'] = round(latencies[-1], 3)
+    summary['latency_ms']['mean'] = round(sum(latencies) / len(latencies), 3)
+    summary['queries'] = {'mean': round(sum(statements) / len(statements), 2),
+                          'max': max(statements)}
+    return summary
+
+
+class Recorder:
+    """Collects the SQL statement count of every request an app finishes"""
+
+    def __init__(self, app):
+        self.statements = None
+        request_finished.connect(self._finished, app)
+
+    def _finished(self, sender, response, **extra):
+        self.statements = g.get('sql_statements', 0)
+
+
+def run_scenario(client, recorder, make_request, iterations, warmup):
+    """Time make_request(client, n) iterations times after warmup untimed calls"""
+    for n in range(warmup):
+        make_request(client, n)
+    latencies, statements, statuses = [], [], {}
+    for n in range(iterations):
+        recorder.statements = None
+        started = time.perf_counter()
+        response = make_request(client, n)
+        latencies.append(time.perf_counter() - started)
+        statements.append(recorder.statements or 0)
+        status = str(response.status_code)
+        statuses[status] = statuses.get(status, 0) + 1
+    return summarise(latencies, statements, statuses)
+
+
+# ---------------------------------------------------------------------
+#  Scenarios
+# ---------------------------------------------------------------------
+def main_scenarios(db_path, rng):
+    """Requests against main.py, keyed by route endpoint"""
+    conn = sqlite3.connect(db_path)
+    class_ids = [row[0] for row in conn.execute("SELECT id FROM Class")]
+    item_ids = [row[0] for row in conn.execute("SELECT id FROM Menu_Items")]
+    rosters = {}
+    for student_id, class_id in conn.execute("SELECT id, class_id FROM Student"):
+        rosters.setdefault(class_id, []).append(student_id)
+    conn.close()
+
+    def save_selections(client, n):
+        class_id = rng.choice(class_ids)
+        form = {'class_id': str(class_id)}
+        form.update((f'student_{student_id}', str(rng.choice(item_ids)))
+                    for student_id in rosters[class_id])
+        return client.post('/save_selections', data=form)
+
+    return {
+        'index': lambda client, n: client.get('/'),
+        'teacher_menu': lambda client, n: client.get(f'/teacher_menu/{rng.choice(class_ids)}'),
+        'save_selections': save_selections,
+        'admin_board': lambda client, n: client.get('/admin'),
+    }
+
+
+def app_scenarios(app_module, rng):
+    """Requests against app.py, keyed by route endpoint; each logs in as a random teacher"""
+    with app_module.app.app_context():
+        teachers = [(teacher.teacher_id, teacher.class_id) for teacher in app_module.get_teachers()]
+        item_ids = [item.item_id for item in app_module.get_menu_items()]
+        rosters = {class_id: [student.student_id for student in app_module.get_students(class_id)]
+                   for _, class_id in teachers}
+    today = date.today()
+    week_start = today - timedelta(days=today.weekday())
+    week_dates = [week_start + timedelta(days=offset) for offset in range(len(DAYS))]
+
+    def login(client):
+        teacher_id, class_id = rng.choice(teachers)
+        with client.session_transaction() as session:
+            session['teacher_id'] = teacher_id
+        return class_id
+
+    def teacher_board(client, n):
+        login(client)
+        return client.get('/teacher')
+
+    def submit_week(client, n):
+        class_id = login(client)
+        with app_module.app.app_context():
+            saved = {(choice.student_id, choice.choice_date): choice.item_id
+                     for choice in app_module.get_week_choices(class_id, week_start)}
+        form = {'week_start': week_start.isoformat()}
+        for student_id in rosters[class_id]:
+            for choice_date, day in zip(week_dates, DAYS):
+                item_id = saved.get((student_id, choice_date))
+                if item_id is None or rng.random() < EDIT_RATIO:
+                    item_id = rng.choice(item_ids)
+                form[f'c-{student_id}-{day}'] = str(item_id)
+        return client.post('/submit_week', data=form)
+
+    return {
+        'teacher_board': teacher_board,
+        'submit_week': submit_week,
+        'admin_menu': lambda client, n: client.get('/admin'),
+    }
+
+
+def load_app_module():
+    """Import app.py, or return None and the reason when its models are not available"""
+    try:
+        import app as app_module
+    except ImportError as e:
+        return None, f'app.py could not be imported: {e}'
+    return app_module, None
+
+
+# ---------------------------------------------------------------------
+#  Baselines
+# ---------------------------------------------------------------------
+def compare(baseline, current, tolerance=DEFAULT_TOLERANCE):
+    """Print p95, query count and error changes; return the scenarios that regressed"""
+    regressions = []
+    for name, result in sorted(current['results'].items()):
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f"{name:<28} new")
+            continue
+        old_p95, new_p95 = before['latency_ms']['p95'], result['latency_ms']['p95']
+        old_queries, new_queries = before['queries']['mean'], result['queries']['mean']
+        old_errors, new_errors = before['errors'], result['errors']
+        # Compared as rates, so runs with a different --requests still line up
+        regressed = (new_p95 > old_p95 * (1 + tolerance) or new_queries > old_queries
+                     or new_errors / result['requests'] > old_errors / before['requests'])
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<28} p95 {old_p95:8.2f} -> {new_p95:8.2f} ms   "
+              f"queries {old_queries:6.1f} -> {new_queries:6.1f}   "
+              f"errors {old_errors} -> {new_errors}"
+              f"{'   REGRESSION' if regressed else ''}")
+    for name in sorted(set(baseline['results']) - set(current['results'])):
+        print(f"{name:<28} not run")
+    return regressions
+
+
+def run(args):
+    school = school_from_args(args)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='cafeteria-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    main_db = os.path.join(workdir, 'main.db')
+    app_db = os.path.join(workdir, 'app.db')
+    rng = random.Random(args.seed)
+    results = {}
+    skipped = {}
+
+    started = time.perf_counter()
+    generate_main_db(main_db, school)
+    print(f"Generated {main_db} in {time.perf_counter() - started:.1f}s")
+    # Both apps read CAFETERIA_DB when they are imported
+    os.environ['CAFETERIA_DB'] = main_db
+    import main
+    main.DB_PATH = main_db
+    targets = [('main', main.app, main_scenarios(main_db, rng))]
+
+    os.environ['CAFETERIA_DB'] = app_db
+    app_module, reason = load_app_module()
+    if app_module is None:
+        skipped['app'] = reason
+        print(f"WARNING: skipping every app.py route, so this run covers main.py only ({reason})")
+    else:
+        started = time.perf_counter()
+        generate_app_db(app_module.app, school)
+        print(f"Generated {app_db} in {time.perf_counter() - started:.1f}s")
+        targets.append(('app', app_module.app, app_scenarios(app_module, rng)))
+
+    for target, flask_app, scenarios in targets:
+        # Failed requests are counted in the report rather than logged one by one
+        flask_app.logger.setLevel(logging.CRITICAL)
+        recorder = Recorder(flask_app)
+        for endpoint, make_request in scenarios.items():
+            if args.only and endpoint not in args.only:
+                continue
+            name = f'{target}:{endpoint}'
+            result = run_scenario(flask_app.test_client(), recorder, make_request,
+                                  args.requests, args.warmup)
+            results[name] = result
+            print(f"{name:<28} p50 {result['latency_ms']['p50']:8.2f}  "
+                  f"p95 {result['latency_ms']['p95']:8.2f}  p99 {result['latency_ms']['p99']:8.2f} ms  "
+                  f"queries {result['queries']['mean']:6.1f}  errors {result['errors']}")
+
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': {'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                        'platform': platform.platform()},
+        'scale': {'classes': args.classes, 'pupils': args.pupils, 'items': args.items,
+                  'years': args.years, 'seed': args.seed},
+        'requests': args.requests,
+        'results': results,
+        'skipped': skipped,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark every page against a generated database and record a JSON baseline.')
+    add_scale_arguments(parser)
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=10, help='untimed requests per route')
+    parser.add_argument('--only', nargs='*', help='endpoints to run, e.g. teacher_menu admin_board')
+    parser.add_argument('--workdir', help='where to write the generated databases')
+    parser.add_argument('--out', default='bench_baseline.json', help='where to write the results')
+    parser.add_argument('--compare', help='baseline JSON to compare the results against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    report = run(args)
+
+    # Timings of a route that fails are not worth keeping or comparing, so
+    # 5xx responses fail the run and no baseline is written from it
+    failing = sorted(name for name, result in report['results'].items() if result['errors'])
+    if failing:
+        print(f"Server errors (5xx) from: {', '.join(failing)}; {args.out} was not written")
+    else:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Results written to {args.out}")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != report['scale']:
+            print("Warning: the baseline was recorded at a different scale")
+        if baseline.get('skipped') != report['skipped']:
+            print(f"Warning: skipped targets differ: {baseline.get('skipped')} -> {report['skipped']}")
+        regressions = compare(baseline, report, args.tolerance)
+    sys.exit(1 if failing or regressions else 0)
@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 30  # seconds an entry is trusted before its version stamps are re-read
+DEFAULT_MAX_ENTRIES = 256
+
+
+class ReferenceCache:
+    """In-process cache for reference data that rarely changes.
+
+    Every entry remembers the version stamps of the tables it was built from.
+    Within the TTL an entry is served without touching the database. After
+    that the stamps are read again through version_source and the entry is
+    only reloaded if one of its tables changed. Write paths in this process
+    call bump() so their own edits show up immediately. The least recently
+    used entries are evicted once max_entries is reached.
+    """
+
+    def __init__(self, version_source=None, ttl=DEFAULT_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.version_source = version_source
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._local_versions = {}
+        self._lock = threading.Lock()
+
+    def _current_versions(self, tables):
+        remote = self.version_source() if self.version_source else {}
+        with self._lock:
+            return tuple((table, self._local_versions.get(table, 0), remote.get(table, 0))
+                         for table in tables)
+
+    def _locally_current(self, versions):
+        return all(self._local_versions.get(table, 0) == local
+                   for table, local, _ in versions)
+
+    def get(self, key, tables, loader):
+        """Return the cached value for key, calling loader() when it is stale"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, versions, checked_at = entry
+                if now - checked_at < self.ttl and self._locally_current(versions):
+                    self._entries.move_to_end(key)
+                    return value
+
+        # Snapshot the stamps before loading, so a write that lands while
+        # loader() runs marks the new entry stale rather than being missed
+        versions = self._current_versions(tables)
+        if entry is not None and entry[1] == versions:
+            value = entry[0]
+        else:
+            value = loader()
+
+        with self._lock:
+            self._entries[key] = (value, versions, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def bump(self, *tables):
+        """Record a local change to tables, invalidating dependent entries"""
+        with self._lock:
+            for table in tables:
+                self._local_versions[table] = self._local_versions.get(table, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,43 @@
+import hashlib
+from datetime import datetime, timezone
+
+from flask import make_response, request, session
+
+
+def make_etag(*parts):
+    """ETag from the data versions a page was built from"""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+
+
+def not_modified(etag, last_modified=None):
+    """A 304 response when the client's copy is current, otherwise None.
+
+    Pages with flash messages waiting are always rebuilt, so the message is
+    not left behind in the session.
+    """
+    if '_flashes' in session:
+        return None
+    if request.if_none_match:
+        current = request.if_none_match.contains(etag)
+    elif request.if_modified_since and last_modified:
+        current = request.if_modified_since >= last_modified.replace(microsecond=0)
+    else:
+        current = False
+    if not current:
+        return None
+    response = make_response('', 304)
+    return with_validators(response, etag, last_modified)
+
+
+def with_validators(response, etag, last_modified=None):
+    """Attach ETag/Last-Modified and ask clients to revalidate each time"""
+    response = make_response(response)
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def timestamp_to_datetime(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc) if seconds else None
@@ -1,11 +1,13 @@
 import sqlite3
 import os
+import sys
 from datetime import datetime
+from urllib.request import pathname2url
 
 
-def init_database():
+def init_database(db_path='cafeteria.db'):
     """Initialize the database with tables"""
-    conn = sqlite3.connect('cafeteria.db')
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
     # Enable foreign key constraints
@@ -61,6 +63,293 @@ def init_database():
     conn.close()
     print("Database tables created successfully!")
 
+    migrate(db_path)
+
+
+# ---------------------------------------------------------------------
+#  Schema migrations
+# ---------------------------------------------------------------------
+# Each migration upgrades the schema by one version. The current version is
+# kept in PRAGMA user_version, so only migrations newer than it are applied.
+def _migration_canonical_dates(cursor):
+    """Store Choices.date as a plain local 'YYYY-MM-DD' and index it"""
+    # Keep the newest row if normalising would collide with UNIQUE(student_id, date)
+    cursor.execute('''
+        DELETE FROM Choices
+        WHERE id NOT IN (
+            SELECT MAX(id) FROM Choices GROUP BY student_id, DATE(date)
+        )
+    ''')
+    cursor.execute('''
+        UPDATE Choices SET date = DATE(date)
+        WHERE date IS NOT DATE(date)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_choices_class_date
+        ON Choices (class_id, date)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_choices_date_item
+        ON Choices (date, menu_item_id)
+    ''')
+
+
+def _migration_daily_item_counts(cursor):
+    """Add the Daily_Item_Counts rollup kept exact by triggers on Choices"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Daily_Item_Counts (
+            date TEXT NOT NULL,
+            menu_item_id INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (date, menu_item_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_choices_count_insert
+        AFTER INSERT ON Choices
+        BEGIN
+            INSERT INTO Daily_Item_Counts (date, menu_item_id, count)
+            VALUES (NEW.date, NEW.menu_item_id, 1)
+            ON CONFLICT (date, menu_item_id) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_choices_count_delete
+        AFTER DELETE ON Choices
+        BEGIN
+            UPDATE Daily_Item_Counts SET count = count - 1
+            WHERE date = OLD.date AND menu_item_id = OLD.menu_item_id;
+            DELETE FROM Daily_Item_Counts
+            WHERE date = OLD.date AND menu_item_id = OLD.menu_item_id AND count <= 0;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_choices_count_update
+        AFTER UPDATE OF date, menu_item_id ON Choices
+        WHEN OLD.date IS NOT NEW.date OR OLD.menu_item_id IS NOT NEW.menu_item_id
+        BEGIN
+            UPDATE Daily_Item_Counts SET count = count - 1
+            WHERE date = OLD.date AND menu_item_id = OLD.menu_item_id;
+            DELETE FROM Daily_Item_Counts
+            WHERE date = OLD.date AND menu_item_id = OLD.menu_item_id AND count <= 0;
+            INSERT INTO Daily_Item_Counts (date, menu_item_id, count)
+            VALUES (NEW.date, NEW.menu_item_id, 1)
+            ON CONFLICT (date, menu_item_id) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    _rebuild_daily_item_counts(cursor)
+
+
+REFERENCE_TABLES = ('Class', 'Menu_Items', 'Student')
+
+
+def _migration_table_versions(cursor):
+    """Add Table_Versions change counters bumped by triggers on reference tables"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Table_Versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for table in REFERENCE_TABLES:
+        cursor.execute('''
+            INSERT OR IGNORE INTO Table_Versions (table_name, version) VALUES (?, 0)
+        ''', (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table.lower()}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE Table_Versions SET version = version + 1
+                    WHERE table_name = '{table}';
+                END
+            ''')
+
+
+def _migration_data_versions(cursor):
+    """Add Data_Versions change counters for all choices and for each class"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Data_Versions (
+            scope TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    bump = '''
+        INSERT INTO Data_Versions (scope, version, updated_at)
+        VALUES ({scope}, 1, CAST(strftime('%s', 'now') AS INTEGER))
+        ON CONFLICT (scope) DO UPDATE SET
+            version = version + 1,
+            updated_at = excluded.updated_at;
+    '''
+    for event, rows in (('INSERT', ('NEW',)), ('UPDATE', ('OLD', 'NEW')), ('DELETE', ('OLD',))):
+        statements = [bump.format(scope="'choices'")]
+        statements += [bump.format(scope=f"'class:' || {row}.class_id") for row in rows]
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_choices_data_version_{event.lower()}
+            AFTER {event} ON Choices
+            BEGIN
+                {''.join(statements)}
+            END
+        ''')
+
+
+def _migration_student_admission_numbers(cursor):
+    """Add Student.admission_number so imports can match pupils on re-run"""
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(Student)")]
+    if 'admission_number' not in columns:
+        cursor.execute("ALTER TABLE Student ADD COLUMN admission_number TEXT")
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_student_admission_number
+        ON Student (admission_number)
+    ''')
+
+
+def _migration_choice_archives(cursor):
+    """Add the Choice_Archives catalogue of per-term archive databases"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Choice_Archives (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT NOT NULL UNIQUE,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            created_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+    ''')
+
+
+def _migration_student_search(cursor):
+    """Add the Student_Search FTS5 index over pupil names, admission numbers and classes"""
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS Student_Search USING fts5(
+            name, admission_number, class_name, class_id UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+    # rowid is the student id, so each pupil has exactly one search row
+    index_student = '''
+        INSERT INTO Student_Search (rowid, name, admission_number, class_name, class_id)
+        SELECT NEW.id, NEW.name, NEW.admission_number, name, id FROM Class WHERE id = NEW.class_id;
+    '''
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_student_search_insert
+        AFTER INSERT ON Student
+        BEGIN
+            {index_student}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_student_search_update
+        AFTER UPDATE OF name, admission_number, class_id ON Student
+        BEGIN
+            DELETE FROM Student_Search WHERE rowid = OLD.id;
+            {index_student}
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_student_search_delete
+        AFTER DELETE ON Student
+        BEGIN
+            DELETE FROM Student_Search WHERE rowid = OLD.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_class_search_update
+        AFTER UPDATE OF name ON Class
+        BEGIN
+            UPDATE Student_Search SET class_name = NEW.name
+            WHERE rowid IN (SELECT id FROM Student WHERE class_id = NEW.id);
+        END
+    ''')
+    cursor.execute("DELETE FROM Student_Search")
+    cursor.execute('''
+        INSERT INTO Student_Search (rowid, name, admission_number, class_name, class_id)
+        SELECT s.id, s.name, s.admission_number, c.name, c.id
+        FROM Student s JOIN Class c ON s.class_id = c.id
+    ''')
+
+
+def _migration_table_version_times(cursor):
+    """Stamp Table_Versions rows with the time of the last reference change"""
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(Table_Versions)")]
+    if 'updated_at' not in columns:
+        cursor.execute("ALTER TABLE Table_Versions ADD COLUMN updated_at INTEGER NOT NULL DEFAULT 0")
+    # When the tables last changed is unknown, and now is never too early
+    cursor.execute("UPDATE Table_Versions SET updated_at = CAST(strftime('%s', 'now') AS INTEGER)")
+    for table in REFERENCE_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table.lower()}_version_{event.lower()}")
+            cursor.execute(f'''
+                CREATE TRIGGER trg_{table.lower()}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE Table_Versions
+                    SET version = version + 1,
+                        updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+                    WHERE table_name = '{table}';
+                END
+            ''')
+
+
+MIGRATIONS = [
+    (1, _migration_canonical_dates),
+    (2, _migration_daily_item_counts),
+    (3, _migration_table_versions),
+    (4, _migration_data_versions),
+    (5, _migration_student_admission_numbers),
+    (6, _migration_choice_archives),
+    (7, _migration_student_search),
+    (8, _migration_table_version_times),
+]
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+MIGRATION_LOCK_TIMEOUT = 60  # seconds to wait while another process migrates
+
+
+def migrate(db_path='cafeteria.db'):
+    """Apply any pending migrations to an existing database in place.
+
+    Raises FileNotFoundError for a missing file rather than creating an empty
+    one. Safe to run from several worker processes at once.
+    """
+    try:
+        # mode=rw never creates the file
+        conn = sqlite3.connect(f'file:{pathname2url(os.path.abspath(db_path))}?mode=rw',
+                               uri=True, timeout=MIGRATION_LOCK_TIMEOUT)
+    except sqlite3.OperationalError:
+        raise FileNotFoundError(f"Database {db_path} not found; run database.py to create it")
+    conn.isolation_level = None  # transactions are managed explicitly below
+    try:
+        version = get_schema_version(conn)
+        for target, migration in MIGRATIONS:
+            if target <= version:
+                continue
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            # Another worker may have applied it while this one waited for the lock
+            version = get_schema_version(conn)
+            if target <= version:
+                cursor.execute("COMMIT")
+                continue
+            try:
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {target:d}")
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            print(f"Migrated database to version {target}: {migration.__doc__}")
+            version = target
+    finally:
+        conn.close()
+    return version
+
 
 def add_sample_data():
     """Add sample data for testing"""
@@ -172,7 +461,137 @@ def view_data():
     conn.close()
 
 
+# ---------------------------------------------------------------------
+#  Daily_Item_Counts rollup maintenance
+# ---------------------------------------------------------------------
+# Days up to the newest archive keep the counts they had when they were
+# archived, so only the days still in Choices are rebuilt or verified
+_DAILY_COUNTS_FROM_CHOICES = '''
+    SELECT date, menu_item_id, COUNT(*) AS count
+    FROM Choices
+    WHERE date > :archived_through
+    GROUP BY date, menu_item_id
+'''
+
+
+def _archived_through(cursor):
+    """Last day moved to an archive database, '' when nothing is archived"""
+    if not cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'Choice_Archives'").fetchone():
+        return ''
+    return cursor.execute("SELECT COALESCE(MAX(end_date), '') FROM Choice_Archives").fetchone()[0]
+
+
+def _rebuild_daily_item_counts(cursor):
+    archived_through = _archived_through(cursor)
+    cursor.execute("DELETE FROM Daily_Item_Counts WHERE date > ?", (archived_through,))
+    cursor.execute(f'''
+        INSERT INTO Daily_Item_Counts (date, menu_item_id, count)
+        {_DAILY_COUNTS_FROM_CHOICES}
+    ''', {'archived_through': archived_through})
+
+
+def rebuild_daily_item_counts(db_path='cafeteria.db'):
+    """Recompute the Daily_Item_Counts rollup from Choices"""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            _rebuild_daily_item_counts(conn.cursor())
+    finally:
+        conn.close()
+    print("Daily item counts rebuilt.")
+
+
+def verify_daily_item_counts(db_path='cafeteria.db'):
+    """Compare the rollup against Choices, skipping days already archived.
+
+    Returns a list of (date, menu_item_id, expected, actual) mismatches.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        # Full outer join emulated with a UNION of both sides
+        mismatches = conn.execute(f'''
+            WITH expected AS ({_DAILY_COUNTS_FROM_CHOICES})
+            SELECT e.date, e.menu_item_id, e.count, d.count
+            FROM expected e
+            LEFT JOIN Daily_Item_Counts d
+                   ON d.date = e.date AND d.menu_item_id = e.menu_item_id
+            WHERE d.count IS NOT e.count
+            UNION ALL
+            SELECT d.date, d.menu_item_id, NULL, d.count
+            FROM Daily_Item_Counts d
+            WHERE d.date > :archived_through AND NOT EXISTS (
+                SELECT 1 FROM Choices c
+                WHERE c.date = d.date AND c.menu_item_id = d.menu_item_id
+            )
+        ''', {'archived_through': _archived_through(conn)}).fetchall()
+    finally:
+        conn.close()
+    return mismatches
+
+
 if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    # Every command below takes the school's database as an optional last
+    # argument, defaulting to CAFETERIA_DB like the apps do
+    default_db = os.environ.get('CAFETERIA_DB', 'cafeteria.db')
+    if command in ('migrate', 'rebuild-counts', 'verify-counts'):
+        if len(sys.argv) > 3:
+            print(f"Usage: python database.py {command} [school database]")
+            sys.exit(2)
+        db_path = sys.argv[2] if len(sys.argv) == 3 else default_db
+        if command == 'migrate':
+            print(f"{db_path} is at schema version {migrate(db_path)}")
+            sys.exit(0)
+        if command == 'rebuild-counts':
+            rebuild_daily_item_counts(db_path)
+            sys.exit(0)
+        mismatches = verify_daily_item_counts(db_path)
+        for day, menu_item_id, expected, actual in mismatches:
+            print(f"{day} item {menu_item_id}: expected {expected}, rollup has {actual}")
+        print(f"{len(mismatches)} mismatched rows")
+        sys.exit(1 if mismatches else 0)
+    if command == 'archive':
+        from archive import archive_choices
+
+        if len(sys.argv) not in (3, 4):
+            print("Usage: python database.py archive <first day of the term to keep, YYYY-MM-DD> "
+                  "[school database]")
+            sys.exit(2)
+        db_path = sys.argv[3] if len(sys.argv) == 4 else default_db
+        migrate(db_path)
+        archive_choices(sys.argv[2], db_path)
+        sys.exit(0)
+    if command == 'freeze':
+        from snapshots import freeze_day
+
+        # Run at the daily order cutoff, e.g. from cron; later edits need override=1
+        if len(sys.argv) > 4:
+            print("Usage: python database.py freeze [day, YYYY-MM-DD; default today] "
+                  "[school database]")
+            sys.exit(2)
+        day = datetime.strptime(sys.argv[2], '%Y-%m-%d') if len(sys.argv) > 2 else datetime.now()
+        day = day.date().isoformat()
+        db_path = sys.argv[3] if len(sys.argv) == 4 else default_db
+        migrate(db_path)
+        freeze_day(day, db_path)
+        sys.exit(0)
+    if command == 'import':
+        from importer import import_data
+
+        paths = sys.argv[2:]
+        # Workbooks, folders and CSVs never end in .db, so a trailing .db is the target
+        db_path = paths.pop() if paths and paths[-1].endswith('.db') else default_db
+        if not paths:
+            print("Usage: python database.py import <workbook.xlsx | folder | sheet.csv>... "
+                  "[school database .db]")
+            sys.exit(2)
+        if not os.path.exists(db_path):
+            init_database(db_path)
+        migrate(db_path)
+        for sheet, count in import_data(paths, db_path).items():
+            print(f"{sheet}: {count}")
+        sys.exit(0)
+
     # Check if database exists
     if not os.path.exists('cafeteria.db'):
         print("Creating new database...")
@@ -0,0 +1,182 @@
+import argparse
+import os
+import random
+import sqlite3
+from datetime import date, timedelta
+
+from database import init_database
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+WEEKS_PER_CYCLE = 3
+ORDER_RATE = 0.9  # share of pupils with an order on a school day
+INSERT_CHUNK_SIZE = 5000
+
+FIRST_NAMES = ['Amara', 'Ben', 'Chloe', 'Daniel', 'Ella', 'Finn', 'Grace', 'Hassan', 'Isla',
+               'Jack', 'Kai', 'Leah', 'Mia', 'Noah', 'Olivia', 'Priya', 'Quinn', 'Ruby',
+               'Sam', 'Tariq', 'Una', 'Victor', 'Wren', 'Yusuf', 'Zara']
+LAST_NAMES = ['Adams', 'Brown', 'Chen', 'Davies', 'Evans', 'Fischer', 'Garcia', 'Hughes',
+              'Ibrahim', 'Jones', 'Khan', 'Lewis', 'Murphy', 'Nowak', "O'Brien", 'Patel',
+              'Roberts', 'Singh', 'Taylor', 'Walker', 'Wilson', 'Young']
+DISHES = ['Pizza', 'Burger', 'Pasta', 'Sandwich', 'Salad', 'Curry', 'Fish and Chips',
+          'Jacket Potato', 'Wrap', 'Soup', 'Roast', 'Stir Fry', 'Tacos', 'Lasagne', 'Risotto']
+
+
+class School:
+    """A seeded, reproducible school: classes, pupils, a menu and order history.
+
+    Everything except the orders is held in memory; orders() regenerates the
+    same stream on every call so years of history never have to be.
+    """
+
+    def __init__(self, classes=40, pupils=28, items=12, years=1, seed=1, end=None):
+        rng = random.Random(seed)
+        self.seed = seed
+        self.class_names = [f'Year {n // 4 + 1}{"ABCD"[n % 4]}' for n in range(classes)]
+        self.items = [DISHES[n % len(DISHES)] + (f' {n // len(DISHES) + 1}' if n >= len(DISHES) else '')
+                      for n in range(items)]
+        # (first name, last name, class index, admission number)
+        self.students = [(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), class_index,
+                          f'{class_index * pupils + n + 1:06d}')
+                         for class_index in range(classes) for n in range(pupils)]
+        # A few dishes are far more popular than the rest
+        self.item_weights = [1 / (rank + 1) for rank in range(items)]
+
+        end = end or date.today()
+        last_monday = end - timedelta(days=end.weekday())
+        first_monday = last_monday - timedelta(weeks=max(1, round(52 * years)) - 1)
+        # (cycle number, week number, Monday, Friday); week_number restarts each cycle
+        self.weeks = []
+        monday = first_monday
+        while monday <= last_monday:
+            index = len(self.weeks)
+            self.weeks.append((index // WEEKS_PER_CYCLE + 1, index % WEEKS_PER_CYCLE + 1,
+                               monday, monday + timedelta(days=4)))
+            monday += timedelta(weeks=1)
+
+    def orders(self):
+        """Yield (student index, class index, date, day name, item index, cycle, week)"""
+        rng = random.Random(self.seed + 1)
+        cum_weights = []
+        total = 0
+        for weight in self.item_weights:
+            total += weight
+            cum_weights.append(total)
+        item_range = range(len(self.items))
+        for cycle_number, week_number, monday, _ in self.weeks:
+            for offset, day_name in enumerate(DAYS):
+                day = monday + timedelta(days=offset)
+                for student_index, (_, _, class_index, _) in enumerate(self.students):
+                    if rng.random() < ORDER_RATE:
+                        item_index = rng.choices(item_range, cum_weights=cum_weights)[0]
+                        yield (student_index, class_index, day, day_name, item_index,
+                               cycle_number, week_number)
+
+
+def _chunks(rows, size=INSERT_CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def generate_main_db(db_path, school):
+    """Write school into a fresh main.py (sqlite3 schema) database"""
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    init_database(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            # Ids are assigned in list order, so index + 1 is the row id
+            conn.executemany("INSERT INTO Class (id, name) VALUES (?, ?)",
+                             enumerate(school.class_names, 1))
+            conn.executemany("INSERT INTO Menu_Items (id, name) VALUES (?, ?)",
+                             enumerate(school.items, 1))
+            conn.executemany(
+                "INSERT INTO Student (id, name, class_id, admission_number) VALUES (?, ?, ?, ?)",
+                ((n, f'{first} {last}', class_index + 1, admission_number)
+                 for n, (first, last, class_index, admission_number)
+                 in enumerate(school.students, 1)))
+            # main.py's Week_Cycles holds one row per whole cycle
+            cycles = {}
+            for cycle_number, _, monday, friday in school.weeks:
+                start, _ = cycles.get(cycle_number, (monday, friday))
+                cycles[cycle_number] = (start, friday)
+            conn.executemany("INSERT INTO Week_Cycles (start_date, end_date) VALUES (?, ?)",
+                             ((start.isoformat(), end.isoformat()) for start, end in cycles.values()))
+            for chunk in _chunks(school.orders()):
+                conn.executemany(
+                    "INSERT INTO Choices (student_id, menu_item_id, class_id, date) VALUES (?, ?, ?, ?)",
+                    [(student_index + 1, item_index + 1, class_index + 1, day.isoformat())
+                     for student_index, class_index, day, _, item_index, _, _ in chunk])
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+def generate_app_db(app, school):
+    """Write school into app's (SQLAlchemy schema) database, replacing its tables"""
+    from database import db, Class, Teacher, Student, MenuItem, WeekCycle, Choice
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        with db.engine.begin() as conn:
+            conn.execute(Class.__table__.insert(),
+                         [{'class_id': n, 'class_name': name}
+                          for n, name in enumerate(school.class_names, 1)])
+            conn.execute(Teacher.__table__.insert(),
+                         [{'teacher_id': n, 'first_name': 'Teacher', 'last_name': name,
+                           'email': f'teacher{n}@school.example', 'class_id': n}
+                          for n, name in enumerate(school.class_names, 1)])
+            conn.execute(MenuItem.__table__.insert(),
+                         [dict({'item_id': n, 'item_name': name},
+                               **{day.lower(): True for day in DAYS})
+                          for n, name in enumerate(school.items, 1)])
+            conn.execute(Student.__table__.insert(),
+                         [{'student_id': n, 'first_name': first, 'last_name': last,
+                           'class_id': class_index + 1, 'admission_number': admission_number}
+                          for n, (first, last, class_index, admission_number)
+                          in enumerate(school.students, 1)])
+            conn.execute(WeekCycle.__table__.insert(),
+                         [{'cycle_number': cycle_number, 'week_number': week_number,
+                           'start_date': monday, 'end_date': friday}
+                          for cycle_number, week_number, monday, friday in school.weeks])
+            for chunk in _chunks(school.orders()):
+                conn.execute(Choice.__table__.insert(),
+                             [{'student_id': student_index + 1, 'class_id': class_index + 1,
+                               'choice_date': day, 'day_of_week': day_name,
+                               'item_id': item_index + 1, 'week_number': week_number,
+                               'cycle_number': cycle_number}
+                              for student_index, class_index, day, day_name, item_index,
+                              cycle_number, week_number in chunk])
+            conn.exec_driver_sql("ANALYZE")
+
+
+def add_scale_arguments(parser):
+    parser.add_argument('--classes', type=int, default=40)
+    parser.add_argument('--pupils', type=int, default=28, help='pupils per class')
+    parser.add_argument('--items', type=int, default=12, help='menu items')
+    parser.add_argument('--years', type=float, default=1, help='years of order history')
+    parser.add_argument('--seed', type=int, default=1)
+
+
+def school_from_args(args):
+    return School(classes=args.classes, pupils=args.pupils, items=args.items,
+                  years=args.years, seed=args.seed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic main.py database.')
+    parser.add_argument('db_path', nargs='?', default='benchmark.db')
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+    generate_main_db(args.db_path, school_from_args(args))
+    conn = sqlite3.connect(args.db_path)
+    for table in ('Class', 'Student', 'Menu_Items', 'Week_Cycles', 'Choices'):
+        print(f"{table}: {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]}")
+    conn.close()
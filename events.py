@@ -0,0 +1,143 @@
+import json
+import queue
+import threading
+
+from flask import Response
+
+SUBSCRIBER_QUEUE_SIZE = 100
+KEEPALIVE_INTERVAL = 15  # seconds between comments that keep proxies from closing the stream
+
+
+class Broker:
+    """In-process publish/subscribe fan-out for server-sent events.
+
+    Only writes made by this worker process are seen, so run the kitchen
+    screens against the same worker (or a single-process server).
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        subscriber = Subscription()
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event, data))
+            except queue.Full:
+                # A screen that stopped reading must not hold up the others;
+                # drop it and let the browser reconnect for a fresh snapshot
+                self.unsubscribe(subscriber)
+                subscriber.dropped = True
+
+
+class Subscription(queue.Queue):
+    def __init__(self):
+        super().__init__(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = False
+
+
+class KitchenFeed:
+    """Today's order counts per menu item and per class, pushed as deltas.
+
+    load_items(day) returns {item name: count} and load_classes(day, class_ids)
+    returns {class name: count}, for every class when class_ids is None. The
+    last published counts are kept here, so each write costs one refresh no
+    matter how many screens are watching, and none at all when none are.
+    """
+
+    def __init__(self, load_items, load_classes):
+        self.load_items = load_items
+        self.load_classes = load_classes
+        self.broker = Broker()
+        self._day = None
+        self._items = {}
+        self._classes = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self, day):
+        items = self.load_items(day)
+        classes = self.load_classes(day, None)
+        with self._lock:
+            self._day, self._items, self._classes = day, dict(items), dict(classes)
+        return {'date': day, 'items': items, 'classes': classes}
+
+    def refresh(self, day, class_ids):
+        """Re-read the counts touched by a committed write and publish changes"""
+        if not len(self.broker):
+            return
+        if day != self._day:
+            # First write of a new day: start every screen from a fresh snapshot
+            self.broker.publish('snapshot', self.snapshot(day))
+            return
+        items = self.load_items(day)
+        classes = self.load_classes(day, class_ids)
+        with self._lock:
+            item_changes = _changes(self._items, items, replace=True)
+            class_changes = _changes(self._classes, classes, replace=False)
+        if item_changes or class_changes:
+            self.broker.publish('delta', {'date': day, 'items': item_changes,
+                                          'classes': class_changes})
+
+
+def _changes(current, fresh, replace):
+    """Update current in place and return {key: new count} for changed keys.
+
+    With replace, keys missing from fresh have dropped to zero.
+    """
+    changes = {key: count for key, count in fresh.items() if current.get(key) != count}
+    if replace:
+        changes.update({key: 0 for key in current if key not in fresh and current[key]})
+        current.clear()
+        current.update((key, count) for key, count in fresh.items())
+    else:
+        current.update(fresh)
+    return changes
+
+
+def _format(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def sse_response(feed, day):
+    """Stream a snapshot followed by deltas until the client disconnects.
+
+    The snapshot is read before the response is returned, so the request's
+    database connection is released rather than held open by the stream.
+    """
+    subscriber = feed.broker.subscribe()
+    try:
+        first = _format('snapshot', feed.snapshot(day))
+    except Exception:
+        feed.broker.unsubscribe(subscriber)
+        raise
+
+    def stream():
+        try:
+            yield first
+            while not subscriber.dropped:
+                try:
+                    event, data = subscriber.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield _format(event, data)
+        finally:
+            feed.broker.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
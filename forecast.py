@@ -0,0 +1,152 @@
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+from week_cycles import CycleWeek, WeekCycleIndex
+
+FORECAST_DAYS = 5  # school days ahead, starting today
+RECENT_WEEKS = 6  # same-weekday days averaged for the expected number of orders
+MIN_CYCLE_SAMPLES = 2  # days needed before a cycle-week mix is trusted over the weekday one
+
+
+def cycle_weeks(rows):
+    """CycleWeek per week of each (start_date, end_date) Week_Cycles row.
+
+    main.py's Week_Cycles rows are whole cycles, numbered here in start date
+    order; week_number counts the weeks from the cycle's start.
+    """
+    weeks = []
+    for cycle_number, (start, end) in enumerate(sorted(rows), 1):
+        start, end = date.fromisoformat(str(start)[:10]), date.fromisoformat(str(end)[:10])
+        week_start = start
+        while week_start <= end:
+            weeks.append(CycleWeek((week_start - start).days // 7 + 1, cycle_number, week_start,
+                                   min(week_start + timedelta(days=6), end)))
+            week_start += timedelta(days=7)
+    return WeekCycleIndex(weeks)
+
+
+def school_days(start, count):
+    """The first count weekdays from start"""
+    days = []
+    day = start
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def _group_mean(values, groups, size):
+    """Row means of values per group id in [0, size), with the per-group row counts"""
+    sums = np.zeros((size,) + values.shape[1:])
+    np.add.at(sums, groups, values)
+    counts = np.bincount(groups, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts.reshape((size,) + (1,) * (values.ndim - 1))
+    return np.nan_to_num(means), counts
+
+
+def build_forecast(counts, item_ids, cycles, today, days=FORECAST_DAYS):
+    """Predicted portions per item for the next school days.
+
+    counts is an iterable of (date, item_id, count) rows, such as the
+    Daily_Item_Counts rollup. Days before today are history; today and
+    later are orders placed so far. The history becomes a dense day x item
+    array. Each item's share of a day's orders is averaged per weekday and
+    per (cycle week, weekday), and the expected number of orders is the mean
+    of the last RECENT_WEEKS same weekdays. Orders already placed are kept,
+    and the expected orders still to come are split by the share.
+
+    Returns a list of dicts with date, cycle_week, expected, ordered,
+    fill_ratio and items ({item_id: predicted portions}).
+    """
+    forecast_days = school_days(today, days)
+    rows = list(counts)
+    day_text, row_items, row_counts = zip(*rows) if rows else ((), (), ())
+    # 'YYYY-MM-DD' strings sort by date, so np.unique also orders the days
+    all_days, day_index = np.unique(np.array([str(day)[:10] for day in day_text], dtype='U10'),
+                                    return_inverse=True)
+    columns = np.full(max(item_ids, default=0) + 1, -1)
+    columns[list(item_ids)] = np.arange(len(item_ids))
+    row_items = np.array(row_items, dtype=int)
+    in_range = (row_items >= 0) & (row_items < len(columns))
+    row_columns = np.full(len(row_items), -1)
+    row_columns[in_range] = columns[row_items[in_range]]
+    known = row_columns >= 0
+
+    dense = np.zeros((len(all_days), len(item_ids)))
+    np.add.at(dense, (day_index.reshape(-1)[known], row_columns[known]),
+              np.array(row_counts, dtype=float)[known])
+    # 1970-01-01 was a Thursday, so shifting by 3 makes Monday 0
+    all_weekdays = (all_days.astype('datetime64[D]').astype(int) + 3) % 7
+    is_history = (all_days < today.isoformat()) & (all_weekdays < 5)
+    history = dense[is_history]
+    observed = np.zeros((len(forecast_days), len(item_ids)))
+    for n, day in enumerate(forecast_days):
+        position = np.searchsorted(all_days, day.isoformat())
+        if position < len(all_days) and all_days[position] == day.isoformat():
+            observed[n] = dense[position]
+
+    dates = [date.fromisoformat(day) for day in all_days[is_history]]
+    weekdays = all_weekdays[is_history]
+    # Cycle weeks are numbered 1..n; 0 collects days outside any cycle
+    cycle_week_numbers = np.array([getattr(cycles.lookup(day), 'week_number', 0) for day in dates],
+                                  dtype=int)
+    max_week = int(cycle_week_numbers.max(initial=0))
+
+    totals = history.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shares = np.nan_to_num(history / totals[:, None])
+    weekday_shares, _ = _group_mean(shares, weekdays, 5)
+    cycle_groups = cycle_week_numbers * 5 + weekdays
+    cycle_shares, cycle_samples = _group_mean(shares, cycle_groups, (max_week + 1) * 5)
+
+    # Days newest first, so the first RECENT_WEEKS per weekday are the recent ones
+    order = np.arange(len(dates))[::-1]
+    rank = np.empty(len(dates), dtype=int)
+    for weekday in range(5):
+        same_day = order[weekdays[order] == weekday]
+        rank[same_day] = np.arange(len(same_day))
+    recent = rank < RECENT_WEEKS
+    expected_totals, _ = _group_mean(totals[recent], weekdays[recent], 5)
+
+    results = []
+    for day, ordered in zip(forecast_days, observed):
+        cycle_week = cycles.lookup(day)
+        group = (cycle_week.week_number if cycle_week else 0) * 5 + day.weekday()
+        if group < len(cycle_samples) and cycle_samples[group] >= MIN_CYCLE_SAMPLES:
+            share = cycle_shares[group]
+        else:
+            share = weekday_shares[day.weekday()]
+        expected = expected_totals[day.weekday()]
+        placed = ordered.sum()
+        predicted = ordered + max(expected - placed, 0) * share
+        results.append({
+            'date': day.isoformat(),
+            'cycle_week': cycle_week.week_number if cycle_week else None,
+            'expected': int(round(max(expected, placed))),
+            'ordered': int(placed),
+            'fill_ratio': round(float(min(placed / expected, 1)), 2) if expected else None,
+            'items': dict(zip(item_ids, np.rint(predicted).astype(int).tolist())),
+        })
+    return results
+
+
+class ForecastCache:
+    """Keeps the last forecast until the data version it was built from changes"""
+
+    def __init__(self):
+        self._version = None
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self, version, build):
+        with self._lock:
+            if self._version == version:
+                return self._value
+        value = build()
+        with self._lock:
+            self._version, self._value = version, value
+        return value
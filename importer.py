@@ -0,0 +1,158 @@
+import csv
+import os
+import sqlite3
+from contextlib import ExitStack
+
+IMPORT_CHUNK_SIZE = 1000
+SHEETS = ('classes', 'menu_items', 'students')
+
+
+def _key(value):
+    """Normalise spreadsheet ids/numbers: 12, 12.0 and '12' all become '12'"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value).strip()
+    return text or None
+
+
+def _records(rows):
+    """Turn a header row plus value rows into dicts keyed by lower-case header"""
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    keys = [_key(h).lower() if _key(h) else None for h in header]
+    for values in rows:
+        record = {k: v for k, v in zip(keys, values) if k}
+        if any(_key(v) for v in record.values()):
+            yield record
+
+
+def _chunks(records, size=IMPORT_CHUNK_SIZE):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _open_sheets(paths, stack):
+    """Map sheet name -> record iterator for .xlsx workbooks, CSV files or folders of CSVs"""
+    sheets = {}
+    for path in paths:
+        if os.path.isdir(path):
+            sheets.update(_open_sheets(
+                [os.path.join(path, f'{name}.csv') for name in SHEETS
+                 if os.path.exists(os.path.join(path, f'{name}.csv'))], stack))
+        elif path.lower().endswith('.xlsx'):
+            try:
+                from openpyxl import load_workbook
+            except ImportError:
+                raise SystemExit("Importing .xlsx files needs openpyxl (pip install openpyxl)")
+            workbook = load_workbook(path, read_only=True, data_only=True)
+            stack.callback(workbook.close)
+            for name in SHEETS:
+                if name in workbook.sheetnames:
+                    sheets[name] = _records(workbook[name].iter_rows(values_only=True))
+        elif path.lower().endswith('.csv'):
+            name = os.path.splitext(os.path.basename(path))[0].lower()
+            if name not in SHEETS:
+                raise SystemExit(f"Don't know what {path} holds; name it one of "
+                                 f"{', '.join(name + '.csv' for name in SHEETS)}")
+            handle = stack.enter_context(open(path, newline='', encoding='utf-8-sig'))
+            sheets[name] = _records(csv.reader(handle))
+        else:
+            raise SystemExit(f"Unsupported import file: {path}")
+    return sheets
+
+
+def _import_classes(conn, records, sheet_class_names):
+    written = 0
+    for chunk in _chunks(records):
+        rows = []
+        for record in chunk:
+            name = _key(record.get('class') or record.get('name'))
+            if name:
+                sheet_class_names[_key(record.get('id'))] = name
+                rows.append((name,))
+        written += conn.executemany(
+            'INSERT INTO Class (name) VALUES (?) ON CONFLICT (name) DO NOTHING', rows).rowcount
+    return written
+
+
+def _import_menu_items(conn, records):
+    written = 0
+    for chunk in _chunks(records):
+        rows = [(name,) for name in (_key(r.get('item') or r.get('name')) for r in chunk) if name]
+        written += conn.executemany(
+            'INSERT INTO Menu_Items (name) VALUES (?) ON CONFLICT (name) DO NOTHING', rows).rowcount
+    return written
+
+
+def _import_students(conn, records, sheet_class_names):
+    class_ids = dict(conn.execute('SELECT name, id FROM Class'))
+    written = skipped = 0
+    for chunk in _chunks(records):
+        by_admission = []
+        by_name = []
+        for record in chunk:
+            name = ' '.join(filter(None, (_key(record.get('firstname')),
+                                          _key(record.get('lastname')))))
+            name = name or _key(record.get('name'))
+            class_name = _key(record.get('class')) or \
+                sheet_class_names.get(_key(record.get('class_id')))
+            class_id = class_ids.get(class_name)
+            if not name or class_id is None:
+                skipped += 1
+                continue
+            admission_number = _key(record.get('admission_number'))
+            if admission_number:
+                by_admission.append((name, class_id, admission_number))
+            else:
+                by_name.append((name, class_id, name, class_id))
+
+        # Admission numbers identify a pupil across re-imports and class moves
+        written += conn.executemany('''
+            INSERT INTO Student (name, class_id, admission_number) VALUES (?, ?, ?)
+            ON CONFLICT (admission_number) DO UPDATE SET
+                name = excluded.name,
+                class_id = excluded.class_id
+            WHERE name IS NOT excluded.name OR class_id IS NOT excluded.class_id
+        ''', by_admission).rowcount
+        written += conn.executemany('''
+            INSERT INTO Student (name, class_id)
+            SELECT ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM Student WHERE name = ? AND class_id = ?)
+        ''', by_name).rowcount
+    return written, skipped
+
+
+def import_data(paths, db_path='cafeteria.db'):
+    """Import classes, menu items and students in a single transaction.
+
+    paths use the layout of exampledata/Example Data DB.xlsx: a classes,
+    menu_items and students sheet (or CSV file named after the sheet), each
+    with a header row. Rows are streamed and written in chunked executemany
+    batches, and re-running an import updates rows instead of duplicating
+    them. Returns the number of rows written per sheet.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    counts = {}
+    try:
+        with ExitStack() as stack, conn:
+            sheets = _open_sheets(paths, stack)
+            # Spreadsheet class ids only mean something inside the file being imported
+            sheet_class_names = {}
+            counts['classes'] = _import_classes(conn, sheets.get('classes', ()), sheet_class_names)
+            counts['menu_items'] = _import_menu_items(conn, sheets.get('menu_items', ()))
+            counts['students'], counts['skipped_students'] = _import_students(
+                conn, sheets.get('students', ()), sheet_class_names)
+    finally:
+        conn.close()
+    return counts
@@ -0,0 +1,365 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+from bench import PERCENTILES, percentile
+from datagen import DAYS, add_scale_arguments, generate_app_db, generate_main_db, school_from_args
+
+EDIT_RATIO = 0.1  # share of a class's cells a teacher changes per submission
+SERVER_START_TIMEOUT = 30  # seconds
+
+
+# ---------------------------------------------------------------------
+#  Server
+# ---------------------------------------------------------------------
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(target, db_path, port, workers, log):
+    """Run target ('main' or 'app') under gunicorn, or forking werkzeug without it.
+
+    Returns the server process and the name of the server used.
+    """
+    env = dict(os.environ, CAFETERIA_DB=db_path)
+    try:
+        import gunicorn  # noqa: F401
+        name = 'gunicorn'
+        command = [sys.executable, '-m', 'gunicorn', '--workers', str(workers),
+                   '--bind', f'127.0.0.1:{port}', f'{target}:app']
+    except ImportError:
+        name = 'werkzeug'
+        print("WARNING: gunicorn is not installed (pip install -r requirements.txt). Falling back to "
+              "werkzeug, which forks a new process for every request instead of running "
+              f"{workers} long-lived workers, so pools and caches never warm up and the "
+              "results do not reflect production.")
+        command = [sys.executable, __file__, 'serve', target, str(port), str(workers)]
+    server = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"Server exited with status {server.returncode}, see {log.name}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server, name
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise SystemExit(f"Server did not start within {SERVER_START_TIMEOUT}s, see {log.name}")
+
+
+def serve(target, port, workers):
+    from werkzeug.serving import run_simple
+
+    module = __import__(target)
+    run_simple('127.0.0.1', port, module.app, processes=workers, threaded=False)
+
+
+# ---------------------------------------------------------------------
+#  Simulated users
+# ---------------------------------------------------------------------
+class Client:
+    """Minimal HTTP client that keeps the session cookie and never follows redirects"""
+
+    def __init__(self, port, session_serializer):
+        self.port = port
+        self.cookie = None
+        self.session_serializer = session_serializer
+
+    def request(self, method, path, form=None):
+        headers = {'Cookie': f'session={self.cookie}'} if self.cookie else {}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        finally:
+            conn.close()
+        for header in response.headers.get_all('Set-Cookie') or ():
+            name, _, value = header.partition(';')[0].partition('=')
+            if name == 'session':
+                self.cookie = value or None
+        return response.status
+
+    def pop_flashes(self):
+        """Categories of the flash messages the last redirect left in the session"""
+        if not self.cookie:
+            return []
+        session = self.session_serializer.loads(self.cookie)
+        flashes = session.pop('_flashes', [])
+        self.cookie = self.session_serializer.dumps(session)
+        return [category for category, _ in flashes]
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+        self.failed_writes = 0
+        self.acknowledged_writes = 0
+
+    def record(self, operation, seconds, status):
+        with self.lock:
+            self.latencies.setdefault(operation, []).append(seconds)
+            key = (operation, status)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+
+def timed(stats, operation, call):
+    started = time.perf_counter()
+    status = call()
+    stats.record(operation, time.perf_counter() - started, status)
+    return status
+
+
+def edit(previous, keys, item_ids, rng):
+    """A new selection: fill blank cells and change EDIT_RATIO of the rest"""
+    return {key: rng.choice(item_ids) if key not in previous or rng.random() < EDIT_RATIO
+            else previous[key] for key in keys}
+
+
+def main_teacher(client, stats, school_info, class_id, rng, stop, think_time, expected):
+    """Open the class page and save today's selections, over and over"""
+    students, item_ids = school_info['rosters'][class_id], school_info['item_ids']
+    selection = {}
+    while not stop.is_set():
+        timed(stats, 'open_page', lambda: client.request('GET', f'/teacher_menu/{class_id}'))
+        time.sleep(rng.uniform(0, think_time))
+        selection = edit(selection, students, item_ids, rng)
+        form = {'class_id': class_id}
+        form.update((f'student_{student_id}', item_id) for student_id, item_id in selection.items())
+        status = timed(stats, 'save', lambda: client.request('POST', '/save_selections', form))
+        track_write(stats, client, status, expected, class_id, selection)
+        time.sleep(rng.uniform(0, think_time))
+
+
+def app_teacher(client, stats, school_info, class_id, rng, stop, think_time, expected):
+    """Log in, open the weekly grid and submit the week, over and over"""
+    students, item_ids = school_info['rosters'][class_id], school_info['item_ids']
+    week_start = school_info['week_start']
+    week_dates = [week_start + timedelta(days=offset) for offset in range(len(DAYS))]
+    cells = [(student_id, choice_date) for student_id in students for choice_date in week_dates]
+    grid = {}
+    # datagen gives every class one teacher with the same id
+    client.request('POST', '/login', {'teacher_id': class_id})
+    while not stop.is_set():
+        timed(stats, 'open_page', lambda: client.request('GET', '/teacher'))
+        time.sleep(rng.uniform(0, think_time))
+        grid = edit(grid, cells, item_ids, rng)
+        form = {'week_start': week_start.isoformat()}
+        form.update((f'c-{student_id}-{DAYS[(choice_date - week_start).days]}', item_id)
+                    for (student_id, choice_date), item_id in grid.items())
+        status = timed(stats, 'save', lambda: client.request('POST', '/submit_week', form))
+        track_write(stats, client, status, expected, class_id, grid)
+        time.sleep(rng.uniform(0, think_time))
+
+
+def track_write(stats, client, status, expected, class_id, cells):
+    """Remember the class's last write the server said it saved"""
+    saved = status < 400 and 'success' in client.pop_flashes()
+    with stats.lock:
+        if saved:
+            stats.acknowledged_writes += 1
+            expected[class_id] = dict(cells)
+        else:
+            stats.failed_writes += 1
+            # An unacknowledged write may or may not have landed
+            expected[class_id] = None
+
+
+def kitchen_screen(client, stats, rng, stop, poll_interval):
+    while not stop.is_set():
+        timed(stats, 'kitchen_poll', lambda: client.request('GET', '/admin'))
+        stop.wait(poll_interval * rng.uniform(0.8, 1.2))
+
+
+# ---------------------------------------------------------------------
+#  Checking and reporting
+# ---------------------------------------------------------------------
+def saved_cells(target, db_path, class_id, school_info):
+    conn = sqlite3.connect(db_path)
+    try:
+        if target == 'main':
+            rows = conn.execute("SELECT student_id, menu_item_id FROM Choices WHERE class_id = ? AND date = ?",
+                                (class_id, school_info['today'].isoformat()))
+            return dict(rows)
+        week_start = school_info['week_start']
+        rows = conn.execute('''
+            SELECT student_id, choice_date, item_id FROM choices
+            WHERE class_id = ? AND choice_date BETWEEN ? AND ?
+        ''', (class_id, week_start.isoformat(), (week_start + timedelta(days=4)).isoformat()))
+        return {(student_id, date.fromisoformat(choice_date)): item_id
+                for student_id, choice_date, item_id in rows}
+    finally:
+        conn.close()
+
+
+def count_lost_writes(target, db_path, expected, school_info):
+    """Cells whose saved value differs from the last acknowledged write to them"""
+    lost = 0
+    for class_id, cells in expected.items():
+        if cells is None:
+            continue
+        saved = saved_cells(target, db_path, class_id, school_info)
+        lost += sum(1 for key, item_id in cells.items() if saved.get(key) != item_id)
+    return lost
+
+
+def report(stats, elapsed, locked_errors, lost_writes, server):
+    operations = {}
+    for operation, latencies in sorted(stats.latencies.items()):
+        latencies = sorted(seconds * 1000 for seconds in latencies)
+        statuses = {str(status): count for (op, status), count in stats.statuses.items()
+                    if op == operation}
+        operations[operation] = {
+            'requests': len(latencies),
+            'throughput': round(len(latencies) / elapsed, 2),
+            'statuses': statuses,
+            'errors': sum(count for status, count in statuses.items() if int(status) >= 500),
+            'latency_ms': dict({f'p{pct}': round(percentile(latencies, pct), 2) for pct in PERCENTILES},
+                               max=round(latencies[-1], 2)),
+        }
+    total = sum(len(latencies) for latencies in stats.latencies.values())
+    return {
+        'server': server,
+        'seconds': round(elapsed, 2),
+        'throughput': round(total / elapsed, 2),
+        'operations': operations,
+        'acknowledged_writes': stats.acknowledged_writes,
+        'failed_writes': stats.failed_writes,
+        'locked_errors': locked_errors,
+        'lost_writes': lost_writes,
+    }
+
+
+def describe(target, db_path):
+    """Class rosters and menu ids read straight from the generated database"""
+    conn = sqlite3.connect(db_path)
+    try:
+        if target == 'main':
+            students = conn.execute("SELECT id, class_id FROM Student ORDER BY id")
+            item_ids = [row[0] for row in conn.execute("SELECT id FROM Menu_Items")]
+        else:
+            students = conn.execute("SELECT student_id, class_id FROM students ORDER BY student_id")
+            item_ids = [row[0] for row in conn.execute("SELECT item_id FROM menu_items")]
+        rosters = {}
+        for student_id, class_id in students:
+            rosters.setdefault(class_id, []).append(student_id)
+    finally:
+        conn.close()
+    today = date.today()
+    return {'rosters': rosters, 'item_ids': item_ids, 'today': today,
+            'week_start': today - timedelta(days=today.weekday())}
+
+
+def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix='cafeteria-load-')
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, f'{args.target}.db')
+    school = school_from_args(args)
+    if args.target == 'main':
+        generate_main_db(db_path, school)
+    else:
+        os.environ['CAFETERIA_DB'] = db_path
+        import app as app_module
+        generate_app_db(app_module.app, school)
+    flask_app = __import__(args.target).app
+    session_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+
+    school_info = describe(args.target, db_path)
+    class_ids = sorted(school_info['rosters'])
+    if args.teachers > len(class_ids):
+        print(f"Only {len(class_ids)} classes; running one teacher per class")
+    # One teacher per class, so the last acknowledged write to a cell must be the saved one
+    class_ids = class_ids[:args.teachers]
+    teacher = main_teacher if args.target == 'main' else app_teacher
+
+    port = free_port()
+    log = open(os.path.join(workdir, 'server.log'), 'w+')
+    server, server_name = start_server(args.target, db_path, port, args.workers, log)
+    stats = Stats()
+    expected = {}
+    stop = threading.Event()
+    rng = random.Random(args.seed)
+    threads = [threading.Thread(target=teacher, daemon=True,
+                                args=(Client(port, session_serializer), stats, school_info, class_id,
+                                      random.Random(rng.random()), stop, args.think_time, expected))
+               for class_id in class_ids]
+    threads += [threading.Thread(target=kitchen_screen, daemon=True,
+                                 args=(Client(port, session_serializer), stats,
+                                       random.Random(rng.random()), stop, args.poll_interval))
+                for _ in range(args.kitchens)]
+    print(f"Running {len(class_ids)} teachers and {args.kitchens} kitchen screens "
+          f"against {args.target}.py with {args.workers} workers for {args.duration}s")
+    started = time.perf_counter()
+    try:
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    log.seek(0)
+    locked_errors = sum(line.count('database is locked') for line in log)
+    log.close()
+    return report(stats, elapsed, locked_errors,
+                  count_lost_writes(args.target, db_path, expected, school_info), server_name)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['serve']:
+        serve(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(
+        description='Simulate the ordering window against a multi-worker server.')
+    add_scale_arguments(parser)
+    parser.add_argument('--target', choices=('main', 'app'), default='main')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--teachers', type=int, default=20, help='concurrent teachers, one per class')
+    parser.add_argument('--kitchens', type=int, default=2, help='kitchen screens polling /admin')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--think-time', type=float, default=0.5,
+                        help='longest pause between a teacher\'s requests, in seconds')
+    parser.add_argument('--poll-interval', type=float, default=2, help='kitchen poll interval, seconds')
+    parser.add_argument('--workdir', help='where to write the database and server log')
+    parser.add_argument('--out', help='also write the report to this JSON file')
+    args = parser.parse_args()
+
+    results = run(args)
+    print(json.dumps(results, indent=2))
+
+    # As in bench.py, a run with server errors fails and its report is not kept
+    failing = sorted(operation for operation, result in results['operations'].items() if result['errors'])
+    if failing:
+        print(f"Server errors (5xx) from: {', '.join(failing)}")
+        if args.out:
+            print(f"{args.out} was not written")
+        sys.exit(1)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
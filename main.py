@@ -1,98 +1,679 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import (Flask, render_template, request, redirect, url_for, flash, g,
+                   abort, has_request_context, jsonify, Response, stream_with_context)
 import sqlite3
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
 import os
+import re
+import queue
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
-DB_PATH = 'cafeteria.db'
+from archive import attached, find_archives
+from cache import ReferenceCache
+from database import migrate
+from events import KitchenFeed, sse_response
+from export import iter_csv, iter_xlsx
+import forecast
+import metrics
+import snapshots
+from conditional import make_etag, not_modified, with_validators, timestamp_to_datetime
+from pagination import PAGE_SIZE, decode_cursor, encode_cursor, page_size_arg
+from tenants import TenantMiddleware, TenantRouter
+from writer import WriteQueue, retry_on_busy
+
+# CAFETERIA_DB points the app at another file, e.g. a generated benchmark database
+DB_PATH = os.environ.get('CAFETERIA_DB', 'cafeteria.db')
+POOL_SIZE = 8
+POOL_TIMEOUT = 10  # seconds to wait for a free connection
+BUSY_TIMEOUT = 5  # seconds SQLite waits on a lock before raising
+REFERENCE_CACHE_TTL = 30  # seconds before version stamps are re-checked
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 50
 
 app = Flask(__name__)
 app.secret_key = 'my-cafeteria-app-secret-key-2024'
+app.config['SLOW_QUERY_THRESHOLD'] = 0.1  # seconds
+# Route class submissions through one writer thread that groups them
+app.config['SINGLE_WRITER'] = False
+# Multi-school mode: one database per school in this folder, picked by a
+# /schools/<id>/ path prefix or an <id>.<CAFETERIA_TENANT_DOMAIN> host
+app.config['TENANT_DIR'] = os.environ.get('CAFETERIA_TENANT_DIR')
+app.config['TENANT_DOMAIN'] = os.environ.get('CAFETERIA_TENANT_DOMAIN')
+app.config['TENANT_IDLE_TIMEOUT'] = 300  # seconds before a quiet school's connections close
+app.wsgi_app = TenantMiddleware(app.wsgi_app, app.config)
+metrics.init_app(app)
+# The shared layout only links the pages this app serves
+app.jinja_env.globals['has_endpoint'] = app.view_functions.__contains__
 
 
 # ---------------------------------------------------------------------
 #  Database helpers
 # ---------------------------------------------------------------------
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that reports a statement's run time to the metrics once it is done.
+
+    SQLite does most of a query's work while its rows are stepped through, so
+    the fetches are timed too and the statement is reported when the cursor is
+    exhausted or closed, or straight away when it returns no rows.
+    """
+    _sql = None
+    _seconds = 0.0
+
+    def _timed(self, call, *args):
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            self._seconds += time.perf_counter() - started
+
+    def _report(self):
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            metrics.record_query_time(sql, self._seconds)
+
+    def _run(self, call, sql, *args):
+        self._report()
+        self._sql, self._seconds = sql, 0.0
+        try:
+            self._timed(call, sql, *args)
+        finally:
+            if self.description is None:
+                self._report()
+        return self
+
+    def execute(self, sql, *args):
+        return self._run(super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._run(super().executemany, sql, *args)
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._report()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if len(rows) < size:
+            self._report()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._report()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self._report()
+            raise
+
+    def close(self):
+        self._report()
+        super().close()
+
+    def __del__(self):
+        # A cursor dropped part-way through still counts
+        self._report()
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose statements and commits are reported to the metrics"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # sqlite3's own shortcuts bypass cursor() and commit(), so route them through
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+    def commit(self):
+        if not self.in_transaction:
+            return super().commit()  # nothing to write, so nothing to time
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            metrics.record_query_time('COMMIT', time.perf_counter() - started)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.rollback()
+            return False
+        try:
+            self.commit()
+        except BaseException:
+            self.rollback()
+            raise
+        return False
+
+
+def open_connection(db_path):
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                           factory=TimedConnection)
     conn.row_factory = sqlite3.Row
-    # Enable foreign key constraints
+    # WAL lets readers carry on while a teacher's submission is being written;
+    # NORMAL is durable in WAL mode apart from the last commits on power loss
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
     conn.execute("PRAGMA foreign_keys = ON")
     return conn
 
 
+class ConnectionPool:
+    """Bounded pool of SQLite connections for one worker process"""
+
+    def __init__(self, db_path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    # Pragmas are per-connection, so they only run once per pooled connection
+                    return open_connection(self.db_path)
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        # Pool exhausted - wait for another request to hand one back
+        return self._idle.get(timeout=self.timeout)
+
+    def in_use(self):
+        """True while any connection is checked out"""
+        return self._created > self._idle.qsize()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+class Shard:
+    """Everything kept per database file: pool, writer, caches and kitchen feed"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path)
+        self.reference_cache = ReferenceCache(version_source=read_table_versions,
+                                              ttl=REFERENCE_CACHE_TTL)
+        # Pushes today's counts to kitchen screens after every committed write
+        self.kitchen_feed = KitchenFeed(load_item_counts, load_class_counts)
+        self.forecast_cache = forecast.ForecastCache()
+        self._write_queue = None
+        self._lock = threading.Lock()
+
+    @property
+    def write_queue(self):
+        with self._lock:
+            if self._write_queue is None:
+                self._write_queue = WriteQueue(lambda: open_connection(self.db_path))
+            return self._write_queue
+
+    def in_use(self):
+        return self.pool.in_use() or len(self.kitchen_feed.broker) > 0
+
+    def close(self):
+        if self._write_queue is not None:
+            self._write_queue.close()
+        self.pool.close_all()
+
+
+def open_shard(db_path):
+    # Each file is brought up to the current schema on first use, so an older
+    # cafeteria.db works under flask run or gunicorn as well as python main.py
+    migrate(db_path)
+    return Shard(db_path)
+
+
+_default_shard = None
+_default_shard_pid = None
+_router = None
+_router_pid = None
+
+
+def get_default_shard():
+    """Return this worker's DB_PATH shard, rebuilding it after a fork"""
+    global _default_shard, _default_shard_pid
+    if _default_shard is None or _default_shard_pid != os.getpid():
+        _default_shard = open_shard(DB_PATH)
+        _default_shard_pid = os.getpid()
+    return _default_shard
+
+
+def get_router():
+    """Return this worker's school router, rebuilding it after a fork"""
+    global _router, _router_pid
+    if _router is None or _router_pid != os.getpid():
+        _router = TenantRouter(app.config['TENANT_DIR'], open_shard,
+                               app.config['TENANT_IDLE_TIMEOUT'])
+        _router_pid = os.getpid()
+    return _router
+
+
+def current_shard():
+    """The shard of the school this request is for, else the DB_PATH one"""
+    if has_request_context() and 'shard' in g:
+        return g.shard
+    return get_default_shard()
+
+
+def get_pool():
+    return current_shard().pool
+
+
+def get_write_queue():
+    return current_shard().write_queue
+
+
+def get_db_connection():
+    """Return the connection bound to the current app context"""
+    if 'db_conn' not in g:
+        pool = get_pool()
+        g.db_conn = pool.acquire()
+        g.db_pool = pool
+    return g.db_conn
+
+
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        g.pop('db_pool').release(conn)
+
+
+def local_today():
+    """Today's local date in the canonical 'YYYY-MM-DD' form stored in Choices.date"""
+    return datetime.now().date().isoformat()
+
+
+def day_started(day, last_modified):
+    """last_modified, moved up to local midnight starting day for pages that change with the date"""
+    midnight = datetime.fromisoformat(day).astimezone(timezone.utc)
+    return max(last_modified, midnight) if last_modified else midnight
+
+
+def read_table_versions():
+    """Current change counters for the reference tables"""
+    return dict(get_db_connection().execute(
+        'SELECT table_name, version FROM Table_Versions').fetchall())
+
+
+def get_data_versions(*scopes):
+    """Reference table versions plus the given Data_Versions scopes.
+
+    Returns the versions as a sorted tuple (for ETags) and the latest
+    updated_at of the scopes as a datetime (for Last-Modified).
+    """
+    placeholders = ', '.join('?' * len(scopes))
+    rows = get_db_connection().execute(f"""
+        SELECT table_name AS scope, version, updated_at FROM Table_Versions
+        UNION ALL
+        SELECT scope, version, updated_at FROM Data_Versions
+        WHERE scope IN ({placeholders})
+    """, scopes).fetchall()
+    versions = tuple(sorted((row['scope'], row['version']) for row in rows))
+    updated_at = max((row['updated_at'] for row in rows), default=0)
+    return versions, timestamp_to_datetime(updated_at)
+
+
 def get_classes():
-    with get_db_connection() as conn:
-        return conn.execute('SELECT * FROM Class ORDER BY name').fetchall()
+    def load():
+        with get_db_connection() as conn:
+            return conn.execute('SELECT * FROM Class ORDER BY name').fetchall()
+    return current_shard().reference_cache.get('classes', ('Class',), load)
+
+
+def get_class(class_id):
+    for class_info in get_classes():
+        if class_info['id'] == class_id:
+            return class_info
+    return None
 
 
 def get_menu_items():
-    with get_db_connection() as conn:
-        return conn.execute('SELECT * FROM Menu_Items ORDER BY name').fetchall()
+    def load():
+        with get_db_connection() as conn:
+            return conn.execute('SELECT * FROM Menu_Items ORDER BY name').fetchall()
+    return current_shard().reference_cache.get('menu_items', ('Menu_Items',), load)
 
 
 def get_students_by_class(class_id):
-    with get_db_connection() as conn:
-        return conn.execute(
-            'SELECT * FROM Student WHERE class_id = ? ORDER BY name',
-            (class_id,)
-        ).fetchall()
+    def load():
+        with get_db_connection() as conn:
+            return conn.execute(
+                'SELECT * FROM Student WHERE class_id = ? ORDER BY name',
+                (class_id,)
+            ).fetchall()
+    return current_shard().reference_cache.get(('students', class_id), ('Student',), load)
 
 
-def save_choice(student_id, menu_item_id, class_id):
-    try:
+# ---------------------------------------------------------------------
+#  Order cutoff
+# ---------------------------------------------------------------------
+ORDERS_CLOSED = 'Orders for today are closed'
+
+
+def override_requested():
+    """True when the request asks to change orders after the cutoff (override=1)"""
+    return has_request_context() and request.values.get('override') == '1'
+
+
+def edits_locked(day):
+    """True when day has been frozen by the cutoff job and no override was given"""
+    return snapshots.is_frozen(current_shard().db_path, day) and not override_requested()
+
+
+def refreeze(day):
+    """Rewrite a frozen day's sheet after an overridden edit so it stays current"""
+    db_path = current_shard().db_path
+    if snapshots.is_frozen(db_path, day):
+        snapshots.write_snapshot(db_path,
+                                 snapshots.read_day_sheet(get_db_connection(), db_path, day))
+
+
+def parse_selections(form):
+    """Collect (student_id, menu_item_id) pairs from student_<id> form fields.
+
+    Returns the valid pairs and the number of fields that could not be parsed.
+    """
+    selections = []
+    errors = 0
+    for key, value in form.items():
+        if not key.startswith('student_') or not value:
+            continue
+        try:
+            selections.append((int(key.split('_', 1)[1]), int(value)))
+        except ValueError as e:
+            errors += 1
+            print(f"Invalid ID format: {e}")
+    return selections, errors
+
+
+def save_choices(class_id, selections):
+    """Save today's choices for a whole class in a single transaction.
+
+    Returns one result dict per selection with 'student_id', 'menu_item_id',
+    'saved' and 'error' keys.
+    """
+    student_ids = {row['id'] for row in get_students_by_class(class_id)}
+    menu_item_ids = {row['id'] for row in get_menu_items()}
+
+    today = local_today()
+    locked = edits_locked(today)
+    results = []
+    rows = []
+    for student_id, menu_item_id in selections:
+        result = {'student_id': student_id, 'menu_item_id': menu_item_id,
+                  'saved': False, 'error': None}
+        if locked:
+            result['error'] = ORDERS_CLOSED
+        elif student_id not in student_ids:
+            result['error'] = 'Student is not in this class'
+        elif menu_item_id not in menu_item_ids:
+            result['error'] = 'Unknown menu item'
+        else:
+            rows.append((student_id, menu_item_id, today, class_id))
+            result['saved'] = True
+        results.append(result)
+
+    if not rows:
+        return results
+
+    def upsert(conn):
+        conn.executemany("""
+            INSERT INTO Choices
+            (student_id, menu_item_id, date, class_id)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(student_id, date) DO UPDATE SET
+                menu_item_id = excluded.menu_item_id,
+                class_id     = excluded.class_id
+        """, rows)
+
+    def write():
         with get_db_connection() as conn:
-            # First, delete any existing choice for this student today
-            today = datetime.now().date()
-            conn.execute("""
-                DELETE FROM Choices 
-                WHERE student_id = ? AND date = ?
-            """, (student_id, today))
+            upsert(conn)
 
-            # Then insert the new choice
-            conn.execute("""
-                INSERT INTO Choices
-                (student_id, menu_item_id, date, class_id)
-                VALUES (?, ?, ?, ?)
-            """, (student_id, menu_item_id, today, class_id))
-            conn.commit()
-            return True
-    except sqlite3.IntegrityError as e:
-        print(f"Database integrity error: {e}")
-        return False
-    except Exception as e:
-        print(f"Database error: {e}")
-        return False
+    try:
+        if app.config['SINGLE_WRITER']:
+            get_write_queue().run(upsert, timeout=POOL_TIMEOUT)
+        else:
+            retry_on_busy(write)
+    except (sqlite3.Error, FutureTimeoutError) as e:
+        # A timed-out job was cancelled by the write queue, so nothing was saved
+        error = str(e)
+        if isinstance(e, FutureTimeoutError):
+            error = 'The database is busy, please try again'
+        print(f"Database error: {error}")
+        for result in results:
+            if result['saved']:
+                result['saved'] = False
+                result['error'] = error
+        return results
 
+    refreeze(today)
+    current_shard().kitchen_feed.refresh(today, [class_id])
+    return results
 
-def get_all_choices():
-    with get_db_connection() as conn:
-        return conn.execute("""
+
+def decode_listing_cursor(cursor):
+    key = decode_cursor(cursor, 4)
+    try:
+        day, class_name, student_name, choice_id = key
+        return str(day), str(class_name), str(student_name), int(choice_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def choice_filters(filter_date=None, filter_class=None, filter_item=None):
+    """WHERE clauses and parameters for the admin listing and export filters"""
+    clauses = []
+    params = []
+    if filter_date:
+        clauses.append('c.date = ?')
+        params.append(filter_date)
+    if filter_class:
+        clauses.append('c.class_id = ?')
+        params.append(filter_class)
+    if filter_item:
+        clauses.append('c.menu_item_id = ?')
+        params.append(filter_item)
+    return clauses, params
+
+
+# Choices comes first (CROSS JOIN keeps it there), so the planner walks the
+# date indexes newest first instead of scanning Student and sorting every row
+CHOICES_PAGE_FROM = """
+    FROM {schema}.Choices c
+    CROSS JOIN Student    s  ON c.student_id   = s.id
+    CROSS JOIN Menu_Items m  ON c.menu_item_id = m.id
+    CROSS JOIN Class      cl ON c.class_id     = cl.id
+"""
+
+
+def _page_start_date(conn, schema, where, params, limit):
+    """Oldest day a page of limit rows reaches, or None when it needs every day.
+
+    Counts the matching rows per day, newest first, and stops reading as soon
+    as enough days are found, so only those days are joined and sorted.
+    """
+    rows = conn.execute(f"""
+        SELECT c.date, COUNT(*)
+        {CHOICES_PAGE_FROM.format(schema=schema)}
+        {where}
+        GROUP BY c.date
+        ORDER BY c.date DESC
+    """, params)
+    total = 0
+    for day, count in rows:
+        total += count
+        if total >= limit:
+            return day
+    return None
+
+
+def _query_choices_page(conn, schema, where, params, limit):
+    def page(clauses, extra):
+        return conn.execute(f"""
             SELECT c.*,
+                   c.date  AS choice_date,
                    s.name  AS student_name,
                    m.name  AS menu_item_name,
                    cl.name AS class_name
-            FROM Choices c
+            {CHOICES_PAGE_FROM.format(schema=schema)}
+            {clauses}
+            ORDER BY c.date DESC, cl.name, s.name, c.id
+            LIMIT ?
+        """, params + extra + [limit]).fetchall()
+
+    start = _page_start_date(conn, schema, where, params, limit)
+    if start is None:
+        return page(where, [])
+    bounded = f"{where} AND c.date >= ?" if where else "WHERE c.date >= ?"
+    return page(bounded, [start])
+
+
+def get_choices_page(filter_date=None, filter_class=None, cursor=None,
+                     page_size=PAGE_SIZE):
+    """One page of choices ordered by (date DESC, class, student).
+
+    Returns the rows and the cursor for the following page, or None on the
+    last page. Archived terms are only attached once the live table cannot
+    fill the page.
+    """
+    clauses, params = choice_filters(filter_date, filter_class)
+    if cursor:
+        day, class_name, student_name, choice_id = cursor
+        # c.date <= ? lets the date indexes start at the cursor's day
+        clauses.append("""c.date <= ? AND (c.date < ? OR (c.date = ? AND
+                          (cl.name, s.name, c.id) > (?, ?, ?)))""")
+        params.extend([day, day, day, class_name, student_name, choice_id])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    conn = get_db_connection()
+    rows = _query_choices_page(conn, 'main', where, params, page_size + 1)
+    if len(rows) <= page_size:
+        # Archives hold older, non-overlapping date ranges, so their rows follow on
+        db_path = current_shard().db_path
+        for archive in find_archives(conn, db_path, filter_date, cursor[0] if cursor else None):
+            with attached(conn, db_path, archive['path']) as schema:
+                rows += _query_choices_page(conn, schema, where, params,
+                                            page_size + 1 - len(rows))
+            if len(rows) > page_size:
+                break
+
+    # The extra row only tells us whether another page exists
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        return rows, encode_cursor([last['date'], last['class_name'],
+                                    last['student_name'], last['id']])
+    return rows, None
+
+
+EXPORT_HEADER = ('Date', 'Class', 'Student', 'Menu Item')
+
+
+def iter_export_rows(filter_date=None, filter_class=None, filter_item=None):
+    """Yield export rows straight from the cursor, one at a time.
+
+    The live table comes first, then each archived term the filters reach.
+    """
+    clauses, params = choice_filters(filter_date, filter_class, filter_item)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    conn = get_db_connection()
+
+    def rows(schema):
+        cursor = conn.execute(f"""
+            SELECT c.date, cl.name, s.name, m.name
+            FROM {schema}.Choices c
             JOIN Student    s  ON c.student_id   = s.id
             JOIN Menu_Items m  ON c.menu_item_id = m.id
             JOIN Class      cl ON c.class_id     = cl.id
+            {where}
             ORDER BY c.date DESC, cl.name, s.name
-        """).fetchall()
+        """, params)
+        try:
+            yield from cursor
+        finally:
+            cursor.close()
+
+    yield from rows('main')
+    db_path = current_shard().db_path
+    for archive in find_archives(conn, db_path, filter_date):
+        with attached(conn, db_path, archive['path']) as schema:
+            yield from rows(schema)
 
 
-def get_choice_statistics():
+def get_choice_statistics(day):
+    # Read the trigger-maintained rollup instead of counting Choices
     with get_db_connection() as conn:
         return conn.execute("""
-            SELECT m.name AS menu_item, 
-                   COUNT(*) AS count,
-                   DATE(c.date) as choice_date
-            FROM Choices c
-            JOIN Menu_Items m ON c.menu_item_id = m.id
-            GROUP BY m.name, DATE(c.date)
-            ORDER BY choice_date DESC, count DESC
-        """).fetchall()
+            SELECT m.name AS menu_item,
+                   d.count AS count
+            FROM Daily_Item_Counts d
+            JOIN Menu_Items m ON d.menu_item_id = m.id
+            WHERE d.date = ? AND d.count > 0
+            ORDER BY count DESC, menu_item
+        """, (day,)).fetchall()
+
+
+def get_demand_forecast():
+    """Predicted portions per item for the coming school days"""
+    versions, _ = get_data_versions('choices')
+    today = local_today()
+    names = {item['id']: item['name'] for item in get_menu_items()}
+
+    def build():
+        conn = get_db_connection()
+        counts = conn.execute("SELECT date, menu_item_id, count FROM Daily_Item_Counts").fetchall()
+        cycles = forecast.cycle_weeks(
+            [tuple(row) for row in conn.execute("SELECT start_date, end_date FROM Week_Cycles")])
+        days = forecast.build_forecast(counts, list(names), cycles, date.fromisoformat(today))
+        for day in days:
+            day['items'] = {names[item_id]: portions for item_id, portions
+                            in sorted(day['items'].items(), key=lambda item: -item[1])}
+        return days
+
+    # Rebuilt once new choices arrive, the day rolls over or the menu changes
+    return current_shard().forecast_cache.get((versions, today, tuple(names.items())), build)
 
 
 def get_today_choices_by_class(class_id):
+    # After the cutoff the frozen sheet already holds the class's orders
+    sheet, _ = snapshots.load_snapshot(current_shard().db_path, local_today())
+    if sheet is not None:
+        return [{'student_name': student_name, 'menu_item_name': item_name}
+                for class_sheet in sheet['classes'] if class_sheet['id'] == class_id
+                for student_name, item_name in class_sheet['students']]
     with get_db_connection() as conn:
         return conn.execute("""
             SELECT s.name as student_name,
@@ -100,9 +681,149 @@ def get_today_choices_by_class(class_id):
             FROM Choices c
             JOIN Student s ON c.student_id = s.id
             JOIN Menu_Items m ON c.menu_item_id = m.id
-            WHERE c.class_id = ? AND DATE(c.date) = DATE('now')
+            WHERE c.class_id = ? AND c.date = ?
             ORDER BY s.name
-        """, (class_id,)).fetchall()
+        """, (class_id, local_today())).fetchall()
+
+
+def search_match(text):
+    """FTS5 query matching every word of text as a prefix, or None for no words"""
+    words = re.findall(r'\w+', text)[:8]
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_students(text, limit=SEARCH_LIMIT):
+    """Pupils whose name, admission number or class match text, best first"""
+    match = search_match(text)
+    if match is None:
+        return []
+    return get_db_connection().execute("""
+        SELECT rowid AS id, name, admission_number, class_name, class_id
+        FROM Student_Search
+        WHERE Student_Search MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    """, (match, limit)).fetchall()
+
+
+def current_school_week():
+    """The Monday to Friday holding today, as 'YYYY-MM-DD' dates"""
+    monday = datetime.strptime(local_today(), '%Y-%m-%d').date()
+    monday -= timedelta(days=monday.weekday())
+    return [(monday + timedelta(days=offset)).isoformat() for offset in range(5)]
+
+
+def get_student(student_id):
+    return get_db_connection().execute("""
+        SELECT s.id, s.name, s.admission_number, s.class_id, cl.name AS class_name
+        FROM Student s
+        JOIN Class cl ON s.class_id = cl.id
+        WHERE s.id = ?
+    """, (student_id,)).fetchone()
+
+
+def get_week_orders(student_ids):
+    """{student_id: [(date, menu item)]} for the Monday to Friday holding today"""
+    if not student_ids:
+        return {}
+    week = current_school_week()
+    rows = get_db_connection().execute(f"""
+        SELECT c.student_id, c.date, m.name
+        FROM Choices c
+        JOIN Menu_Items m ON c.menu_item_id = m.id
+        WHERE c.student_id IN ({', '.join('?' * len(student_ids))})
+          AND c.date BETWEEN ? AND ?
+        ORDER BY c.date
+    """, list(student_ids) + [week[0], week[-1]]).fetchall()
+    orders = {}
+    for student_id, choice_date, item in rows:
+        orders.setdefault(student_id, []).append((choice_date, item))
+    return orders
+
+
+def load_item_counts(day):
+    rows = get_db_connection().execute("""
+        SELECT m.name, d.count
+        FROM Daily_Item_Counts d
+        JOIN Menu_Items m ON d.menu_item_id = m.id
+        WHERE d.date = ?
+    """, (day,)).fetchall()
+    return {name: count for name, count in rows}
+
+
+def load_class_counts(day, class_ids=None):
+    where = ''
+    params = [day]
+    if class_ids is not None:
+        where = f"WHERE cl.id IN ({', '.join('?' * len(class_ids))})"
+        params.extend(class_ids)
+    rows = get_db_connection().execute(f"""
+        SELECT cl.name, COUNT(c.id)
+        FROM Class cl
+        LEFT JOIN Choices c ON c.class_id = cl.id AND c.date = ?
+        {where}
+        GROUP BY cl.id
+    """, params).fetchall()
+    return {name: count for name, count in rows}
+
+
+# ---------------------------------------------------------------------
+#  Schools
+# ---------------------------------------------------------------------
+# Routes that work across schools rather than inside one
+CROSS_SCHOOL_ENDPOINTS = {'school_totals', 'prometheus_metrics', 'static'}
+
+
+@app.before_request
+def select_shard():
+    if not app.config['TENANT_DIR'] or request.endpoint in CROSS_SCHOOL_ENDPOINTS:
+        return
+    school = request.environ.get('cafeteria.school')
+    shard = get_router().get(school) if school else None
+    if shard is None:
+        abort(404)
+    g.shard = shard
+
+
+def school_summary(shard, day):
+    """Pupil, class and order counts for one school's day, read from its rollup"""
+    conn = shard.pool.acquire()
+    try:
+        pupils, classes = conn.execute(
+            "SELECT (SELECT COUNT(*) FROM Student), (SELECT COUNT(*) FROM Class)").fetchone()
+        items = dict(conn.execute("""
+            SELECT m.name, d.count
+            FROM Daily_Item_Counts d
+            JOIN Menu_Items m ON d.menu_item_id = m.id
+            WHERE d.date = ?
+        """, (day,)).fetchall())
+    finally:
+        shard.pool.release(conn)
+    return {'pupils': pupils, 'classes': classes, 'orders': sum(items.values()), 'items': items}
+
+
+@app.route('/admin/schools')
+def school_totals():
+    """Per-school and combined order counts for a day, queried in parallel"""
+    if not app.config['TENANT_DIR']:
+        abort(404)
+    day = request.args.get('date') or local_today()
+    results = get_router().fan_out(lambda shard: school_summary(shard, day))
+
+    schools = {}
+    totals = {'pupils': 0, 'classes': 0, 'orders': 0, 'items': {}}
+    for school, summary in results.items():
+        if isinstance(summary, Exception):
+            schools[school] = {'error': str(summary)}
+            continue
+        schools[school] = summary
+        for key in ('pupils', 'classes', 'orders'):
+            totals[key] += summary[key]
+        for item, count in summary['items'].items():
+            totals['items'][item] = totals['items'].get(item, 0) + count
+    return jsonify({'date': day, 'schools': schools, 'totals': totals})
 
 
 # ---------------------------------------------------------------------
@@ -115,10 +836,15 @@ def index():
 
 @app.route('/teacher_menu/<int:class_id>')
 def teacher_menu(class_id):
-    with get_db_connection() as conn:
-        class_info = conn.execute(
-            'SELECT * FROM Class WHERE id = ?', (class_id,)
-        ).fetchone()
+    versions, last_modified = get_data_versions(f'class:{class_id}')
+    today = local_today()
+    etag = make_etag('teacher_menu', class_id, today, versions)
+    last_modified = day_started(today, last_modified)
+    cached = not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+
+    class_info = get_class(class_id)
 
     if class_info is None:
         flash('Class not found', 'error')
@@ -127,13 +853,13 @@ def teacher_menu(class_id):
     # Get today's choices for this class
     today_choices = get_today_choices_by_class(class_id)
 
-    return render_template(
+    return with_validators(render_template(
         'teacher_menu.html',
         class_info=class_info,
         menu_items=get_menu_items(),
         students=get_students_by_class(class_id),
         today_choices=today_choices
-    )
+    ), etag, last_modified)
 
 
 @app.route('/save_selections', methods=['POST'])
@@ -147,30 +873,17 @@ def save_selections():
         # Convert class_id to integer
         class_id = int(class_id)
 
-        # Track if any selections were saved
-        selections_saved = 0
-        errors = 0
+        # Validate every student_* field before touching the database
+        selections, errors = parse_selections(request.form)
+        results = save_choices(class_id, selections)
 
-        # Process each student selection
-        for key, value in request.form.items():
-            if key.startswith('student_'):
-                try:
-                    student_id = int(key.split('_', 1)[1])
-                    if value:  # Only save if a menu item was selected
-                        menu_item_id = int(value)
-                        if save_choice(student_id, menu_item_id, class_id):
-                            selections_saved += 1
-                        else:
-                            errors += 1
-                except ValueError as e:
-                    errors += 1
-                    print(f"Invalid ID format: {e}")
-                except Exception as e:
-                    errors += 1
-                    print(f"Error saving choice: {e}")
+        selections_saved = sum(1 for result in results if result['saved'])
+        errors += len(results) - selections_saved
 
         # Provide feedback
-        if selections_saved > 0 and errors == 0:
+        if any(result['error'] == ORDERS_CLOSED for result in results):
+            flash(f'{ORDERS_CLOSED}; your selections were not saved.', 'error')
+        elif selections_saved > 0 and errors == 0:
             flash(f'Successfully saved {selections_saved} selections!', 'success')
         elif selections_saved > 0 and errors > 0:
             flash(f'Saved {selections_saved} selections, but {errors} failed.', 'warning')
@@ -187,25 +900,161 @@ def save_selections():
         return redirect(url_for('index'))
 
 
+@app.route('/search')
+def search():
+    text = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', SEARCH_LIMIT, type=int), 1), MAX_SEARCH_LIMIT)
+    students = search_students(text, limit)
+    orders = get_week_orders([student['id'] for student in students])
+
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify([
+            dict(student, orders=orders.get(student['id'], []),
+                 url=url_for('student_week', student_id=student['id']))
+            for student in students
+        ])
+    return render_template('search.html', q=text, students=students, orders=orders)
+
+
+@app.route('/students/<int:student_id>')
+def student_week(student_id):
+    """A pupil's orders for the current school week, linked from search results"""
+    student = get_student(student_id)
+    if student is None:
+        abort(404)
+    orders = dict(get_week_orders([student_id]).get(student_id, []))
+    week = [{'date': day, 'day': date.fromisoformat(day).strftime('%A'),
+             'menu_item': orders.get(day)}
+            for day in current_school_week()]
+
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(dict(student, week=week))
+    return render_template('student_week.html', student=student, week=week)
+
+
+@app.route('/sheets/<day>')
+def day_sheet(day):
+    """A day's per-item and per-class sheets.
+
+    Days frozen by the cutoff job are read from disk alone; any other day is
+    built from the database on each request and never frozen here.
+    """
+    try:
+        day = date.fromisoformat(day).isoformat()
+    except ValueError:
+        abort(404)
+    db_path = current_shard().db_path
+    sheet, mtime = snapshots.load_snapshot(db_path, day)
+
+    if sheet is not None:
+        etag = make_etag('sheet', day, mtime)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+    else:
+        versions, _ = get_data_versions('choices')
+        etag = make_etag('sheet', day, versions)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+        sheet = snapshots.read_day_sheet(get_db_connection(), db_path, day)
+
+    if request.accept_mimetypes.best == 'application/json':
+        return with_validators(jsonify(sheet), etag)
+    return with_validators(render_template('day_sheet.html', sheet=sheet), etag)
+
+
 @app.route('/admin')
 def admin_board():
-    return render_template(
+    versions, last_modified = get_data_versions('choices')
+    # The forecast and today's portions move on with the date even when no choices change
+    today = local_today()
+    etag = make_etag('admin', request.query_string, versions, today)
+    last_modified = day_started(today, last_modified)
+    cached = not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+
+    filter_date = request.args.get('filter_date') or None
+    filter_class = request.args.get('filter_class', '')
+    filter_class = int(filter_class) if filter_class.isdigit() else None
+    cursor = request.args.get('cursor')
+    cursor = decode_listing_cursor(cursor) if cursor else None
+    page_size = page_size_arg(request.args)
+
+    choices, next_cursor = get_choices_page(filter_date, filter_class,
+                                            cursor, page_size)
+    # Portions for the filtered day, or today's when no date is picked
+    stats_date = filter_date or today
+    return with_validators(render_template(
         'admin_board.html',
-        choices=get_all_choices(),
-        stats=get_choice_statistics()
+        choices=choices,
+        next_cursor=next_cursor,
+        classes=get_classes(),
+        stats_date=stats_date,
+        stats=get_choice_statistics(stats_date),
+        forecast=get_demand_forecast()
+    ), etag, last_modified)
+
+
+def export_filters():
+    """Read the date, class and item filters from the query string"""
+    filter_class = request.args.get('filter_class', '')
+    filter_item = request.args.get('filter_item', '')
+    return (request.args.get('filter_date') or None,
+            int(filter_class) if filter_class.isdigit() else None,
+            int(filter_item) if filter_item.isdigit() else None)
+
+
+@app.route('/admin/export.csv')
+def export_csv():
+    rows = iter_export_rows(*export_filters())
+    return Response(
+        stream_with_context(iter_csv(EXPORT_HEADER, rows)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=orders.csv'}
+    )
+
+
+@app.route('/admin/export.xlsx')
+def export_xlsx():
+    rows = iter_export_rows(*export_filters())
+    return Response(
+        stream_with_context(iter_xlsx(EXPORT_HEADER, rows)),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers={'Content-Disposition': 'attachment; filename=orders.xlsx'}
     )
 
 
+@app.route('/kitchen')
+def kitchen():
+    return render_template('kitchen.html')
+
+
+@app.route('/kitchen/stream')
+def kitchen_stream():
+    return sse_response(current_shard().kitchen_feed, local_today())
+
+
 @app.route('/clear_today_choices/<int:class_id>')
 def clear_today_choices(class_id):
     """Clear all choices for today for a specific class"""
-    try:
+    today = local_today()
+    if edits_locked(today):
+        flash('Orders for today are closed; they can no longer be cleared.', 'error')
+        return redirect(url_for('teacher_menu', class_id=class_id))
+
+    def clear():
         with get_db_connection() as conn:
             conn.execute("""
                 DELETE FROM Choices 
-                WHERE class_id = ? AND DATE(date) = DATE('now')
-            """, (class_id,))
-            conn.commit()
+                WHERE class_id = ? AND date = ?
+            """, (class_id, today))
+
+    try:
+        retry_on_busy(clear)
+        refreeze(today)
+        current_shard().kitchen_feed.refresh(today, [class_id])
         flash('Today\'s choices cleared successfully!', 'success')
     except Exception as e:
         flash(f'Error clearing choices: {str(e)}', 'error')
@@ -217,6 +1066,12 @@ def clear_today_choices(class_id):
 #  Boot-up
 # ---------------------------------------------------------------------
 if __name__ == '__main__':
+    if app.config['TENANT_DIR']:
+        schools = get_router().schools()
+        print(f"Serving {len(schools)} schools from {app.config['TENANT_DIR']}: {', '.join(schools)}")
+        app.run(debug=True)
+        exit(0)
+
     # Check if database exists
     if not os.path.exists(DB_PATH):
         print(f"Database {DB_PATH} not found!")
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, has_app_context, current_app, request
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+DEFAULT_SLOW_QUERY_THRESHOLD = 0.1  # seconds
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with one series per label set"""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{_labels(labels)} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+
+    def inc(self, labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_labels(labels)} {value}')
+        return lines
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + [(key, value) for key, value in extra.items()]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metrics:
+    """Per-worker registry of request and SQL metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_seconds = Histogram(
+            'http_request_duration_seconds', 'Request latency by route.', LATENCY_BUCKETS)
+        self.requests = Counter(
+            'http_requests_total', 'Requests by route and status.')
+        self.request_statements = Histogram(
+            'http_request_sql_statements', 'SQL statements run per request.', STATEMENT_BUCKETS)
+        self.request_sql_seconds = Histogram(
+            'http_request_sql_seconds', 'Time spent in SQL per request.', LATENCY_BUCKETS)
+        self.slow_queries = Counter(
+            'sql_slow_queries_total', 'Statements slower than the slow query threshold.')
+
+    def observe_request(self, endpoint, method, status, seconds, statements, sql_seconds):
+        route = (('endpoint', endpoint), ('method', method))
+        with self._lock:
+            self.request_seconds.observe(route, seconds)
+            self.requests.inc(route + (('status', status),))
+            self.request_statements.observe(route, statements)
+            self.request_sql_seconds.observe(route, sql_seconds)
+
+    def observe_slow_query(self, endpoint):
+        with self._lock:
+            self.slow_queries.inc((('endpoint', endpoint),))
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.request_seconds, self.requests, self.request_statements,
+                           self.request_sql_seconds, self.slow_queries):
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+# ---------------------------------------------------------------------
+#  Hooks called by the database layers
+# ---------------------------------------------------------------------
+def record_query_time(statement, seconds):
+    """Count a statement the request ran, add its run time and log it if it was slow.
+
+    Callers report each statement they execute once. Statements run by
+    triggers are part of it, so they do not inflate the per-request count.
+    """
+    if not has_app_context():
+        return
+    g.sql_statements = g.get('sql_statements', 0) + 1
+    g.sql_seconds = g.get('sql_seconds', 0.0) + seconds
+    threshold = current_app.config.get('SLOW_QUERY_THRESHOLD', DEFAULT_SLOW_QUERY_THRESHOLD)
+    if seconds >= threshold:
+        endpoint = request.endpoint if request else None
+        metrics.observe_slow_query(endpoint or 'none')
+        logger.warning('Slow query (%.1f ms) in %s: %s',
+                       seconds * 1000, endpoint, ' '.join(statement.split()))
+
+
+# ---------------------------------------------------------------------
+#  Flask wiring
+# ---------------------------------------------------------------------
+def init_app(app):
+    """Time every request and serve the registry at /metrics"""
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_seconds = 0.0
+
+    @app.after_request
+    def record_request(response):
+        started = g.get('request_started')
+        if started is not None:
+            metrics.observe_request(
+                request.endpoint or 'none', request.method, response.status_code,
+                time.perf_counter() - started,
+                g.get('sql_statements', 0), g.get('sql_seconds', 0.0))
+        return response
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,26 @@
+import base64
+import json
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(key):
+    """Opaque keyset cursor for a list of JSON-serialisable sort key values"""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor, size):
+    """Sort key values from a cursor, or None if it is malformed"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(key, list) or len(key) != size:
+        return None
+    return key
+
+
+def page_size_arg(args):
+    """The per_page query argument clamped to 1..MAX_PAGE_SIZE"""
+    return min(max(args.get('per_page', PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
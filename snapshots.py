@@ -0,0 +1,117 @@
+import gzip
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from archive import attached, find_archives
+
+SNAPSHOT_DIR = 'snapshots'  # next to the live database
+CACHE_SIZE = 64  # sheets kept in memory per process
+
+
+def snapshot_path(db_path, day):
+    """snapshots/<db name>/<day>.json.gz next to the database, one folder per school"""
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), SNAPSHOT_DIR, stem,
+                        f'{day}.json.gz')
+
+
+def is_frozen(db_path, day):
+    """True once the cutoff job has written the day's sheet"""
+    return os.path.exists(snapshot_path(db_path, day))
+
+
+def read_day_sheet(conn, db_path, day):
+    """Build a day's sheet from main.py's schema.
+
+    Items come from the Daily_Item_Counts rollup, as in get_choice_statistics;
+    each class lists its pupils' orders, as in get_today_choices_by_class,
+    read from the term archive when the day has been archived. Every class is
+    included, so a class that ordered nothing shows as empty.
+    """
+    items = conn.execute("""
+        SELECT m.name, d.count
+        FROM Daily_Item_Counts d
+        JOIN Menu_Items m ON d.menu_item_id = m.id
+        WHERE d.date = ? AND d.count > 0
+        ORDER BY d.count DESC, m.name
+    """, (day,)).fetchall()
+    classes = {class_id: {'id': class_id, 'name': name, 'students': []}
+               for class_id, name in conn.execute("SELECT id, name FROM Class ORDER BY name")}
+
+    def add_orders(schema):
+        for class_id, student_name, item_name in conn.execute(f"""
+            SELECT c.class_id, s.name, m.name
+            FROM {schema}.Choices c
+            JOIN Student s ON c.student_id = s.id
+            JOIN Menu_Items m ON c.menu_item_id = m.id
+            WHERE c.date = ?
+            ORDER BY c.class_id, s.name
+        """, (day,)):
+            if class_id in classes:
+                classes[class_id]['students'].append([student_name, item_name])
+
+    add_orders('main')
+    # Archives hold whole, non-overlapping date ranges, so at most one has the day
+    for path, _, _ in find_archives(conn, db_path, day):
+        with attached(conn, db_path, path) as schema:
+            add_orders(schema)
+    return {'date': day,
+            'items': [[name, count] for name, count in items],
+            'classes': list(classes.values())}
+
+
+def write_snapshot(db_path, sheet):
+    """Freeze a sheet to disk, replacing any earlier one for the same day in one step"""
+    sheet = dict(sheet, frozen_at=datetime.now().isoformat(timespec='seconds'))
+    path = snapshot_path(db_path, sheet['date'])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        json.dump(sheet, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    return path
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def load_snapshot(db_path, day):
+    """The frozen sheet for day and its file's mtime, or (None, None) when not frozen.
+
+    Sheets are kept in memory until their file changes, so a re-freeze after
+    an override is picked up by every worker.
+    """
+    path = snapshot_path(db_path, day)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None, None
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            _cache.move_to_end(path)
+            return cached[1], mtime
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        sheet = json.load(f)
+    with _cache_lock:
+        _cache[path] = (mtime, sheet)
+        _cache.move_to_end(path)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return sheet, mtime
+
+
+def freeze_day(day, db_path='cafeteria.db'):
+    """The cutoff job: write day's sheet from the database at db_path"""
+    conn = sqlite3.connect(db_path)
+    try:
+        path = write_snapshot(db_path, read_day_sheet(conn, db_path, day))
+    finally:
+        conn.close()
+    print(f"Froze orders for {day} into {path}")
+    return path
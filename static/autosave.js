@@ -0,0 +1,42 @@
+// Save a grid cell as soon as its select changes instead of posting the
+// whole form. "Save All Orders" still works as a fallback.
+document.addEventListener('DOMContentLoaded', function () {
+    var form = document.querySelector('form[data-autosave-url]');
+    if (!form) {
+        return;
+    }
+
+    form.addEventListener('change', function (event) {
+        var select = event.target;
+        if (!select.matches('select[data-student-id]')) {
+            return;
+        }
+
+        select.classList.remove('saved', 'save-error');
+        select.classList.add('saving');
+
+        fetch(form.dataset.autosaveUrl, {
+            method: 'PATCH',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({
+                cells: [{
+                    student_id: select.dataset.studentId,
+                    date: select.dataset.date,
+                    item_id: select.value || null
+                }]
+            })
+        }).then(function (response) {
+            if (!response.ok) {
+                throw new Error('Save failed with status ' + response.status);
+            }
+            return response.json();
+        }).then(function (data) {
+            form.dataset.version = data.version;
+            select.classList.remove('saving');
+            select.classList.add('saved');
+        }).catch(function () {
+            select.classList.remove('saving');
+            select.classList.add('save-error');
+        });
+    });
+});
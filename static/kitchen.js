@@ -0,0 +1,52 @@
+// Keep the kitchen tables current from the /kitchen/stream server-sent events.
+// A snapshot replaces the counts; a delta only carries the counts that changed.
+document.addEventListener('DOMContentLoaded', function () {
+    var board = document.querySelector('[data-stream-url]');
+    if (!board) {
+        return;
+    }
+
+    var counts = {items: {}, classes: {}};
+
+    function render(kind, selector) {
+        var body = board.querySelector(selector);
+        var names = Object.keys(counts[kind]).sort();
+        body.innerHTML = '';
+        names.forEach(function (name) {
+            if (kind === 'items' && !counts[kind][name]) {
+                return;
+            }
+            var row = document.createElement('tr');
+            var label = document.createElement('td');
+            var value = document.createElement('td');
+            label.textContent = name;
+            value.textContent = counts[kind][name];
+            row.appendChild(label);
+            row.appendChild(value);
+            body.appendChild(row);
+        });
+    }
+
+    function apply(data, replace) {
+        ['items', 'classes'].forEach(function (kind) {
+            if (replace) {
+                counts[kind] = {};
+            }
+            Object.keys(data[kind]).forEach(function (name) {
+                counts[kind][name] = data[kind][name];
+            });
+        });
+        board.querySelector('.kitchen-date').textContent = '(' + data.date + ')';
+        render('items', '.kitchen-items');
+        render('classes', '.kitchen-classes');
+    }
+
+    // EventSource reconnects by itself and the server starts each connection with a snapshot
+    var source = new EventSource(board.dataset.streamUrl);
+    source.addEventListener('snapshot', function (event) {
+        apply(JSON.parse(event.data), true);
+    });
+    source.addEventListener('delta', function (event) {
+        apply(JSON.parse(event.data), false);
+    });
+});
@@ -0,0 +1,129 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SCHOOL_ID = re.compile(r'^[a-z0-9][a-z0-9-]{0,62}$')
+PATH_PREFIX = '/schools'
+IDLE_TIMEOUT = 300  # seconds before an unused school's connections are closed
+SWEEP_INTERVAL = 30  # seconds between idle sweeps
+MAX_FAN_OUT = 8  # schools queried at once by cross-school aggregates
+
+
+class TenantRouter:
+    """Maps school ids to per-school shards, one SQLite file per school.
+
+    open_shard(db_path) is called the first time a school is used and must
+    return an object with close() and in_use(). Shards that have not been
+    used for idle_timeout seconds, and are not in use, are closed again.
+    """
+
+    def __init__(self, directory, open_shard, idle_timeout=IDLE_TIMEOUT):
+        self.directory = directory
+        self.open_shard = open_shard
+        self.idle_timeout = idle_timeout
+        self._shards = {}
+        self._last_used = {}
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._shards)
+
+    def db_path(self, school):
+        """The school's database file, or None for an unknown school"""
+        if not school or not SCHOOL_ID.match(school):
+            return None
+        path = os.path.join(self.directory, f'{school}.db')
+        return path if os.path.exists(path) else None
+
+    def schools(self):
+        """Every school with a database file, sorted"""
+        return sorted(name[:-3] for name in os.listdir(self.directory)
+                      if name.endswith('.db') and SCHOOL_ID.match(name[:-3]))
+
+    def get(self, school):
+        """The school's shard, opening it on first use; None for an unknown school"""
+        now = time.monotonic()
+        with self._lock:
+            shard = self._shards.get(school)
+            if shard is None:
+                path = self.db_path(school)
+                if path is None:
+                    return None
+                shard = self._shards[school] = self.open_shard(path)
+            self._last_used[school] = now
+            sweep = now - self._last_sweep >= SWEEP_INTERVAL
+        if sweep:
+            self.evict_idle(now)
+        return shard
+
+    def evict_idle(self, now=None):
+        """Close shards unused for idle_timeout seconds; returns the schools closed"""
+        now = time.monotonic() if now is None else now
+        closed = []
+        with self._lock:
+            self._last_sweep = now
+            for school, shard in list(self._shards.items()):
+                if now - self._last_used[school] >= self.idle_timeout and not shard.in_use():
+                    del self._shards[school]
+                    del self._last_used[school]
+                    closed.append((school, shard))
+        for _, shard in closed:
+            shard.close()
+        return [school for school, _ in closed]
+
+    def close_all(self):
+        with self._lock:
+            shards = list(self._shards.values())
+            self._shards.clear()
+            self._last_used.clear()
+        for shard in shards:
+            shard.close()
+
+    def fan_out(self, query, schools=None, max_workers=MAX_FAN_OUT):
+        """Run query(shard) for every school in parallel.
+
+        Returns {school: result}; a school whose query raised maps to the
+        exception instead, so one broken file does not hide the others.
+        """
+        schools = self.schools() if schools is None else schools
+
+        def run(school):
+            try:
+                return query(self.get(school))
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(schools, executor.map(run, schools)))
+
+
+class TenantMiddleware:
+    """WSGI middleware that finds the school a request is for.
+
+    The school comes from a <school>.<TENANT_DOMAIN> host, or else from a
+    /schools/<school> path prefix, which is moved onto SCRIPT_NAME so the
+    app's routes and url_for work unchanged. The id is left in
+    environ['cafeteria.school']. Does nothing unless TENANT_DIR is set.
+    """
+
+    def __init__(self, wsgi_app, config):
+        self.wsgi_app = wsgi_app
+        self.config = config
+
+    def __call__(self, environ, start_response):
+        school = None
+        if self.config.get('TENANT_DIR'):
+            domain = self.config.get('TENANT_DOMAIN')
+            host = environ.get('HTTP_HOST', '').split(':')[0].lower()
+            if domain and host.endswith('.' + domain):
+                school = host[:-len(domain) - 1]
+            path = environ.get('PATH_INFO', '')
+            if school is None and path.startswith(PATH_PREFIX + '/'):
+                school, _, rest = path[len(PATH_PREFIX) + 1:].partition('/')
+                environ['SCRIPT_NAME'] = f"{environ.get('SCRIPT_NAME', '')}{PATH_PREFIX}/{school}"
+                environ['PATH_INFO'] = '/' + rest
+        environ['cafeteria.school'] = school
+        return self.wsgi_app(environ, start_response)
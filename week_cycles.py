@@ -0,0 +1,46 @@
+from bisect import bisect_right
+from collections import namedtuple
+
+CycleWeek = namedtuple('CycleWeek', 'week_number cycle_number start_date end_date')
+
+
+class WeekCycleIndex:
+    """Sorted interval index answering "which cycle week is this date in?".
+
+    Built once from all week cycle rows, then each lookup is a bisect over
+    the start dates instead of a database query.
+    """
+
+    def __init__(self, cycles):
+        self._cycles = sorted((c for c in cycles
+                               if c.start_date is not None and c.end_date is not None),
+                              key=lambda c: (c.start_date, c.end_date))
+        self._starts = [c.start_date for c in self._cycles]
+        # Running maximum of end dates, so a backwards scan can stop as soon as
+        # no earlier interval can still cover the date (handles overlaps)
+        self._max_ends = []
+        for cycle in self._cycles:
+            previous = self._max_ends[-1] if self._max_ends else cycle.end_date
+            self._max_ends.append(max(previous, cycle.end_date))
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from any rows with week_number, cycle_number, start_date and end_date"""
+        return cls(CycleWeek(r.week_number, r.cycle_number, r.start_date, r.end_date)
+                   for r in rows)
+
+    def __len__(self):
+        return len(self._cycles)
+
+    def lookup(self, day):
+        """The CycleWeek covering day, or None"""
+        i = bisect_right(self._starts, day) - 1
+        while i >= 0 and self._max_ends[i] >= day:
+            if self._cycles[i].end_date >= day:
+                return self._cycles[i]
+            i -= 1
+        return None
+
+    def resolve(self, days):
+        """Map each of days to its CycleWeek (or None)"""
+        return {day: self.lookup(day) for day in days}
@@ -0,0 +1,139 @@
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.05  # seconds, doubled on every attempt
+MAX_BATCH = 32  # jobs grouped into one transaction
+
+
+def is_busy_error(exc):
+    """True for SQLite lock contention errors, raw or wrapped by SQLAlchemy"""
+    exc = getattr(exc, 'orig', None) or exc
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    message = str(exc)
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def retry_on_busy(operation, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY,
+                  on_retry=None):
+    """Call operation(), retrying with backoff while the database is locked.
+
+    on_retry() runs before each new attempt, e.g. to roll back a session.
+    """
+    for attempt in range(attempts):
+        try:
+            return operation()
+        except Exception as e:
+            if not is_busy_error(e) or attempt == attempts - 1:
+                raise
+            if on_retry is not None:
+                on_retry()
+            time.sleep(base_delay * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+class WriteQueue:
+    """Single writer thread that groups queued jobs into shared transactions.
+
+    A job is a callable taking a sqlite3 connection. Jobs that queue up while
+    a transaction is running are committed together in the next one, so many
+    concurrent submissions cost one lock acquisition and one fsync. Every job
+    runs in its own savepoint, so one failing job does not undo the others.
+    """
+
+    def __init__(self, connect, max_batch=MAX_BATCH):
+        self._connect = connect
+        self.max_batch = max_batch
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        """Queue job and return a Future for its result"""
+        future = Future()
+        self._jobs.put((job, future))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sqlite-writer',
+                                                daemon=True)
+                self._thread.start()
+        return future
+
+    def run(self, job, timeout=None):
+        """Queue job and wait for it to be committed.
+
+        Raises TimeoutError if the job was still queued after timeout seconds;
+        it is then cancelled and never runs. A job that has already started
+        is waited for, so the caller always learns whether it was saved.
+        """
+        future = self.submit(job)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise
+            return future.result()
+
+    def close(self):
+        """Stop the writer thread once the jobs already queued are committed"""
+        with self._lock:
+            if self._thread is not None:
+                self._jobs.put(None)
+                self._thread = None
+
+    def _run(self):
+        conn = self._connect()
+        conn.isolation_level = None  # transactions are managed explicitly
+        try:
+            while True:
+                batch = [self._jobs.get()]
+                while len(batch) < self.max_batch and batch[-1] is not None:
+                    try:
+                        batch.append(self._jobs.get_nowait())
+                    except queue.Empty:
+                        break
+                # None is the stop marker queued by close()
+                stopping = batch[-1] is None
+                if stopping:
+                    batch.pop()
+                if batch:
+                    self._run_batch(conn, batch)
+                if stopping:
+                    return
+        finally:
+            conn.close()
+
+    def _run_batch(self, conn, batch):
+        # From here on the jobs can no longer be cancelled; cancelled ones are skipped
+        batch = [(job, future) for job, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes = []
+        try:
+            retry_on_busy(lambda: conn.execute("BEGIN IMMEDIATE"))
+            for job, future in batch:
+                conn.execute("SAVEPOINT job")
+                try:
+                    outcomes.append((future, job(conn), None))
+                    conn.execute("RELEASE job")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    outcomes.append((future, None, e))
+            retry_on_busy(lambda: conn.execute("COMMIT"))
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)